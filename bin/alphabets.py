@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Rebuild the persisted MLRegTest alphabet index.
+
+The index is rebuilt automatically when the Small directory changes, so
+this is only needed to warm it up before launching many jobs or after
+files were modified in place.
+
+Example Usage:
+    $ alphabets.py
+"""
+from src.core.context import Context
+from src.core.app import harness
+from src.data.mlrt import ALPHABET_INDEX, build_alphabet_index
+
+
+def main(ctx: Context) -> None:
+    ctx.parser.add_argument("-o", "--outpath", default=ALPHABET_INDEX)
+    args = ctx.parser.parse_args()
+
+    for size, alphabet in build_alphabet_index(args.outpath).items():
+        ctx.log.info("alphabet %d: %s", size, "".join(alphabet))
+    ctx.log.info("wrote: %s", args.outpath)
+
+
+if __name__ == "__main__":
+    harness(main)
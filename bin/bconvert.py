@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Convert MLRegTest or FlexFringe files to binary traces.
+
+Binary traces are memory-mapped by FFColumns.from_path instead of being
+parsed from text, so they can be used anywhere a FlexFringe file is read.
+
+Example Usage:
+    $ bconvert.py
+    $ bconvert.py -i ../FlexFringe/data/MLRegTestPS -o ../FlexFringe/data/MLRegTestPSBin
+"""
+import os
+import glob
+
+from src.bin.flexfringe import FF_DIR
+from src.core.context import Context
+from src.core.app import harness
+from src.data.mlrt import MLRegTestFile
+
+
+def main(ctx: Context) -> None:
+    default_indir = os.path.join(FF_DIR, "data", "MLRegTest")
+    ctx.parser.add_argument("-i", "--indir", default=default_indir)
+    ctx.parser.add_argument("-o", "--outdir", default=f"{default_indir}Bin")
+    ctx.parser.add_argument(
+        "-f", "--force", action="store_true", help="overwrite existing"
+    )
+    args = ctx.parser.parse_args()
+
+    for data_size in ("Small", "Mid", "Large"):
+        outdir = os.path.join(args.outdir, data_size)
+        os.makedirs(outdir, exist_ok=True)
+        for path in glob.glob(os.path.join(args.indir, data_size, "*")):
+            bname = os.path.splitext(os.path.basename(path))[0]
+            outpath = os.path.join(outdir, f"{bname}.ffb")
+            if os.path.exists(outpath) and not args.force:
+                continue  # Skip existing files.
+            MLRegTestFile.from_path(path).write_binary(outpath)
+            ctx.log.info("wrote: %s", outpath)
+
+
+if __name__ == "__main__":
+    harness(main)
@@ -12,6 +12,7 @@ from itertools import islice
 
 from src.core.context import Context
 from src.core.app import harness
+from src.core.functional import atomic_open
 from src.core.slurm import sbatch
 from src.bin.flexfringe import FF_DIR
 
@@ -29,10 +30,11 @@ def batched(iterable, n):
 # TODO: Maybe this should just merge with eval.py?
 def main(ctx: Context) -> None:
     ctx.parser.add_argument("paths", nargs="+", help="model paths")
+    ctx.parser.add_argument("-o", "--outpath", default=os.path.join(FF_DIR, "evals.db"))
+    ctx.parser.add_argument("-n", "--batch-size", type=int, default=32)
     ctx.parser.add_argument(
-        "-o", "--outpath", default=os.path.join(FF_DIR, "evals.csv")
+        "-s", "--shards", type=int, help="submit N balanced shards instead of batches"
     )
-    ctx.parser.add_argument("-n", "--batch-size", type=int, default=32)
     ctx.parser.add_argument(
         "-y", "--dryrun", action="store_true", help="don't send to slurm"
     )
@@ -43,6 +45,20 @@ def main(ctx: Context) -> None:
     if len(args.paths) == 1 and args.paths[0].endswith(".txt"):
         with open(args.paths[0], "r") as fd:
             paths = [ln.strip() for ln in fd]
+    # Submit shards, each of which reads the full list of paths from a file
+    # since thousands of them would not fit on a command line.
+    if args.shards:
+        evalpy = os.path.abspath(sys.argv[0]).replace("beval", "eval")
+        root, ext = os.path.splitext(args.outpath)
+        listpath = f"{os.path.abspath(root)}.models.txt"
+        with atomic_open(listpath) as fd:
+            fd.write("\n".join(os.path.abspath(path) for path in paths if path.strip()))
+        ctx.log.info("wrote: %s", listpath)
+        for idx in range(args.shards):
+            cmd = f"{listpath} -o {args.outpath} -s {idx}/{args.shards}"
+            sbatch(f"python -u {evalpy} {cmd}", dryrun=args.dryrun)
+        ctx.log.info("merge with: merge.py %s.*-of-%d%s", root, args.shards, ext)
+        return
     # Submit jobs.
     for batch in batched(paths, args.batch_size):
         cmd = " ".join(list(batch) + [f"-o {args.outpath}"])
@@ -1,31 +1,129 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-"""Convert MLRegTest files to FlexFringe format."""
-import os
+"""
+Convert MLRegTest files to FlexFringe format.
+
+A manifest in the output directory records the size, modification time and
+hash of every converted source so reruns only convert new or changed files.
+Outputs from before the manifest are adopted if they are complete.
+
+Example Usage:
+    $ convert.py
+    $ convert.py -w 28
+"""
 import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import suppress
+from typing import Any
+
+from tqdm import tqdm
 
 from src.bin.flexfringe import FF_DIR
 from src.core.context import Context
 from src.core.app import harness
+from src.core.functional import atomic_open, sha1sum
+from src.data.flexfringe import CHUNK_BYTES
 from src.data.mlrt import MLRT_DIR, MLRegTestFile
 
 
+MANIFEST = ".manifest.json"
+
+
+def stamp(path: str, digest: bool = True) -> dict[str, Any]:
+    stat = os.stat(path)
+    ret = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if digest:
+        ret["sha1"] = sha1sum(path)
+    return ret
+
+
+def is_current(path: str, outpath: str, entry: dict[str, Any]) -> bool:
+    """Checks if outpath was converted from the current contents of path."""
+    if not entry or not os.path.exists(outpath):
+        return False
+    if all(entry[key] == val for key, val in stamp(path, digest=False).items()):
+        return True
+    return entry["sha1"] == sha1sum(path)
+
+
+def is_complete(path: str) -> bool:
+    """Checks that a flexfringe file has every sample its header promises."""
+    with suppress(OSError, ValueError, IndexError), open(path, "rb") as fd:
+        num_samples = int(fd.readline().split()[0])
+        count, last = 0, b"\n"
+        while block := fd.read(CHUNK_BYTES):
+            count += block.count(b"\n")
+            last = block[-1:]
+        count += last != b"\n"
+        # A write cut off mid line still counts, so check the last line too.
+        fd.seek(max(0, fd.tell() - 2**16))
+        tokens = fd.read().rstrip(b"\n").rsplit(b"\n", 1)[-1].split()
+        return count == num_samples and (
+            not num_samples or len(tokens) == int(tokens[1]) + 2
+        )
+    return False
+
+
+def sync(
+    path: str, outpath: str, entry: dict[str, Any], force: bool = False
+) -> tuple[dict[str, Any], bool]:
+    """
+    Converts path unless outpath is already up to date.
+
+    Runs in a worker since checking may mean hashing the whole source.
+
+    Returns:
+        The new manifest entry and whether the file was converted.
+    """
+    if not force and os.path.exists(outpath):
+        if not entry and is_complete(outpath):
+            return stamp(path), False  # Adopt files from before the manifest.
+        if entry and is_current(path, outpath, entry):
+            return entry | stamp(path, digest=False), False  # Touched, not changed.
+    ret = stamp(path)
+    MLRegTestFile.from_path(path).save_flexfringe(outpath)
+    return ret, True
+
+
 def main(ctx: Context) -> None:
     default_outdir = os.path.join(FF_DIR, "data", "MLRegTest")
     ctx.parser.add_argument("-o", "--outdir", default=default_outdir)
+    ctx.parser.add_argument("-w", "--workers", type=int, default=1)
+    ctx.parser.add_argument(
+        "-f", "--force", action="store_true", help="overwrite existing"
+    )
     args = ctx.parser.parse_args()
-
+    # Read the manifest if it exists.
+    manifest_path = os.path.join(args.outdir, MANIFEST)
+    manifest: dict[str, dict[str, Any]] = {}
+    with suppress(FileNotFoundError):
+        with open(manifest_path, "r") as fd:
+            manifest = json.load(fd)
+    # Every file is checked in a worker, since that may mean hashing it.
+    jobs = {}
     for data_size in ("Small", "Mid", "Large"):
-        outdir = os.path.join(args.outdir, data_size)
-        os.makedirs(outdir, exist_ok=True)
+        os.makedirs(os.path.join(args.outdir, data_size), exist_ok=True)
         for path in glob.glob(os.path.join(MLRT_DIR, data_size, "*")):
-            outpath = os.path.join(outdir, os.path.basename(path))
-            if os.path.exists(outpath):
-                continue  # Skip existing files.
-            mlrt_file = MLRegTestFile.from_path(path)
-            with open(outpath, "w") as fd:
-                fd.write(mlrt_file.to_string())
-            ctx.log.info(f"wrote: %s", outpath)
+            key = os.path.join(data_size, os.path.basename(path))
+            jobs[key] = (path, os.path.join(args.outdir, key))
+    ctx.log.info("checking %d files", len(jobs))
+    # Convert and record each file as it finishes.
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futures = {
+                pool.submit(sync, *job, manifest.get(key, {}), args.force): key
+                for key, job in jobs.items()
+            }
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                key = futures[future]
+                manifest[key], converted = future.result()
+                if converted:
+                    ctx.log.info("wrote: %s", jobs[key][1])
+    finally:
+        with atomic_open(manifest_path) as fd:
+            json.dump(manifest, fd, indent=1, sort_keys=True)
 
 
 if __name__ == "__main__":
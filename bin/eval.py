@@ -1,71 +1,286 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """Evaluate flexfringe models on all corresponding data."""
+import argparse
+import heapq
+import multiprocessing
 import os
-from contextlib import suppress
-from dataclasses import asdict
-from glob import glob
-from typing import Any
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Iterator, Optional
 
-import evaluate
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
 from src.core.context import Context
 from src.core.app import harness
-from src.core.df import update
+from src.core.bootstrap import intervals, resample_counts
+from src.core.functional import atomic_open
+from src.core.metrics import confusion, from_confusion
+from src.core.store import write_results
 from src.bin.flexfringe import FF_DIR
-from src.data.flexfringe import FFModel
+from src.data.flexfringe import (
+    DATA_DIR,
+    MODEL_CACHE_DIR,
+    FFColumns,
+    FFModel,
+    data_paths,
+    predict_many,
+)
 
 
-MLRT_DIR = os.path.join(FF_DIR, "data", "MLRegTest")
-CACHE_DIR = os.path.join(os.path.dirname(FF_DIR), ".cache")
+LENGTH_KEYS = ["model_path", "data_path", "length"]
+MODELS: dict[str, FFModel] = {}  # Filled before workers fork, then read-only.
 
 
-def compute(model: FFModel, path: str) -> dict[str, Any]:
-    ret = {k: v for k, v in vars(model).items() if k not in ("path", "machine", "dfa")}
+def metrics(
+    model: FFModel, path: str, counts: np.ndarray, bootstrap: int = 0
+) -> dict[str, Any]:
+    ret = model.metadata
     ret["split"] = os.path.splitext(os.path.basename(path))[0].split("_")[-1]
-    df = pd.DataFrame(map(asdict, model.evaluate(path)))
-    #  df = pd.DataFrame(map(asdict, model.results(path)))  # Uses sicco method.
-    for metric in ("accuracy", "precision", "recall", "f1", "brier_score"): #  "roc_auc"?
-        ret |= evaluate.load(
-            metric,
-            experiment_id=str(pd.Timestamp.now()),
-            cache_dir=CACHE_DIR,  # My home runs out of Disk...
-        ).compute(predictions=df.pred, references=df.label)
+    ret |= from_confusion(counts)  #  "roc_auc"?
+    if bootstrap:
+        ret |= intervals(resample_counts(counts, bootstrap))
     ret["model_path"] = os.path.abspath(model.path)
     ret["data_path"] = os.path.abspath(path)
     return ret
 
 
+def length_metrics(
+    model: FFModel, path: str, counts: np.ndarray, length_bucket: int
+) -> list[dict[str, Any]]:
+    """One row per non-empty bucket of string lengths, keyed by its shortest."""
+    rets = []
+    for bucket, ((tn, fp), (fn, tp)) in enumerate(counts.tolist()):
+        if tn + fp + fn + tp == 0:
+            continue
+        ret = {
+            "model_path": os.path.abspath(model.path),
+            "data_path": os.path.abspath(path),
+            "split": os.path.splitext(os.path.basename(path))[0].split("_")[-1],
+            "length": bucket * length_bucket,
+            "tn": tn,
+            "fp": fp,
+            "fn": fn,
+            "tp": tp,
+        }
+        rets.append(ret | from_confusion([[tn, fp], [fn, tp]]))
+    return rets
+
+
+def compute_many(
+    models: list[FFModel],
+    path: str,
+    shared_prefixes: bool = False,
+    samples_dir: Optional[str] = None,
+    length_bucket: int = 1,
+    bootstrap: int = 0,
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """
+    Evaluates every model on one data file, reading the data only once.
+
+    Confusion counts are kept per bucket of string lengths, so the overall
+    and per-length metrics come from the same pass. If bootstrap is set,
+    95% intervals for accuracy and f1 are added from that many resamples of
+    the counts. Nothing else is kept unless samples_dir is given, in which
+    case every label and prediction is also saved there as <size>_<name>.npz.
+
+    Returns:
+        The overall metrics and the per-length metrics of every model.
+    """
+    by_length = np.zeros((len(models), 0, 2, 2), dtype=np.int64)
+    labels, preds = [], []
+    for data in FFColumns.iter_chunks(path):
+        pred = predict_many(models, data, shared_prefixes)
+        new = confusion(data.labels, pred, data.lengths // length_bucket)
+        # Later chunks may have longer strings.
+        if new.shape[1] > by_length.shape[1]:
+            new[:, : by_length.shape[1]] += by_length
+            by_length = new
+        else:
+            by_length[:, : new.shape[1]] += new
+        if samples_dir:
+            labels.append(data.labels)
+            preds.append(pred)
+    if samples_dir:
+        save_samples(samples_dir, models, path, labels, preds)
+    counts = by_length.sum(axis=1)
+    return (
+        [metrics(m, path, c, bootstrap) for m, c in zip(models, counts)],
+        [
+            ret
+            for m, c in zip(models, by_length)
+            for ret in length_metrics(m, path, c, length_bucket)
+        ],
+    )
+
+
+def save_samples(
+    samples_dir: str,
+    models: list[FFModel],
+    path: str,
+    labels: list[np.ndarray],
+    preds: list[np.ndarray],
+) -> None:
+    dsize = os.path.basename(os.path.dirname(path))
+    bname = os.path.splitext(os.path.basename(path))[0]
+    with atomic_open(os.path.join(samples_dir, f"{dsize}_{bname}.npz"), "wb") as fd:
+        np.savez_compressed(
+            fd,
+            model_paths=np.array([os.path.abspath(m.path) for m in models]),
+            labels=np.concatenate(labels),
+            preds=np.concatenate(preds, axis=1),
+        )
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """Parses i/N where 0 <= i < N."""
+    index, count = map(int, spec.split("/"))
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"invalid shard: {spec}")
+    return index, count
+
+
+def shard_path(path: str, index: int, count: int) -> str:
+    """Where a shard writes its results, e.g. evals.0-of-4.csv."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}-of-{count}{ext}"
+
+
+def shard(jobs: dict[str, list[str]], index: int, count: int) -> dict[str, list[str]]:
+    """
+    Deterministically splits work into count shards of similar cost.
+
+    Each data file goes, with every model that uses it, to the shard with
+    the least work so far. Cost is the file size times the number of
+    models and the biggest units are placed first.
+
+    Args:
+        jobs: The models to evaluate on each data file.
+        index: Which shard to keep.
+        count: How many shards there are.
+
+    Returns:
+        The part of jobs that belongs to this shard.
+    """
+    cost = {dpath: os.path.getsize(dpath) * len(jobs[dpath]) for dpath in jobs}
+    loads = [(0, idx) for idx in range(count)]
+    ret = {}
+    for dpath in sorted(jobs, key=lambda dpath: (-cost[dpath], dpath)):
+        load, idx = heapq.heappop(loads)
+        heapq.heappush(loads, (load + cost[dpath], idx))
+        if idx == index:
+            ret[dpath] = jobs[dpath]
+    return ret
+
+
+def run(
+    dpath: str, mpaths: list[str], kwargs: dict[str, Any]
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """Evaluates already loaded models on one data file, possibly in a worker."""
+    return compute_many([MODELS[path] for path in mpaths], dpath, **kwargs)
+
+
+def run_all(
+    units: list[tuple[str, list[str]]], args: argparse.Namespace
+) -> Iterator[tuple[list[dict[str, Any]], list[dict[str, Any]]]]:
+    """Yields the output of run() for each unit of work as it finishes."""
+    kwargs = {
+        "shared_prefixes": args.shared_prefixes,
+        "samples_dir": args.samples_dir,
+        "length_bucket": args.length_bucket,
+        "bootstrap": args.bootstrap,
+    }
+    if args.workers <= 1:
+        for dpath, mpaths in units:
+            yield run(dpath, mpaths, kwargs)
+        return
+    with ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("fork")
+    ) as pool:
+        futures = [pool.submit(run, dpath, mpaths, kwargs) for dpath, mpaths in units]
+        for future in as_completed(futures):
+            yield future.result()
+
+
 def main(ctx: Context) -> None:
     ctx.parser.add_argument("paths", nargs="+", help="model paths")
-    ctx.parser.add_argument("-o", "--outpath", default=os.path.join(FF_DIR, "evals.csv"))
+    ctx.parser.add_argument("-o", "--outpath", default=os.path.join(FF_DIR, "evals.db"))
+    ctx.parser.add_argument(
+        "-d", "--datadir", default=DATA_DIR, help="text or binary (bconvert.py) data"
+    )
+    ctx.parser.add_argument(
+        "--model-cache", default=MODEL_CACHE_DIR, help="compiled model cache dir"
+    )
+    ctx.parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="evaluate in parallel"
+    )
+    ctx.parser.add_argument(
+        "-s",
+        "--shard",
+        type=parse_shard,
+        help="only evaluate shard i/N and write it next to outpath (see merge.py)",
+    )
+    ctx.parser.add_argument(
+        "--samples-dir", help="also save every label and prediction here"
+    )
+    ctx.parser.add_argument(
+        "--bootstrap", type=int, default=0, help="resamples for confidence intervals"
+    )
+    ctx.parser.add_argument(
+        "--length-bucket", type=int, default=1, help="width of per-length buckets"
+    )
+    ctx.parser.add_argument(
+        "--shared-prefixes", action="store_true", help="walk a prefix trie of the data"
+    )
+    ctx.parser.add_argument(
+        "--no-minimize", dest="minimize", action="store_false", help="skip minimizing"
+    )
     args = ctx.parser.parse_args()
-    ctx.log.info("model paths: %s", args.paths)
+    # Parse the given paths or read from file.
+    paths = args.paths
+    if len(args.paths) == 1 and args.paths[0].endswith(".txt"):
+        with open(args.paths[0], "r") as fd:
+            paths = [ln.strip() for ln in fd if ln.strip()]
+    if args.shard:
+        args.outpath = shard_path(args.outpath, *args.shard)
+    ctx.log.info("model paths: %s", paths)
     ctx.log.info("outpath: %s", args.outpath)
-    # Read existing file if it exists.
-    current = pd.DataFrame()
-    with suppress(FileNotFoundError):
-        current = pd.read_csv(args.outpath)
-    # Evaluate the given models.
-    results = []
-    for path in tqdm(args.paths):
-        assert path.endswith(".final.json")
-        _, dstr, msize = os.path.basename(path).replace(".final.json", "").split("_")
-        # Always evaluate on large but include same msize train as a sanity check.
-        dpaths =  glob(os.path.join(MLRT_DIR, "Large", f"{dstr}_Test*"))
-        dpaths += glob(os.path.join(MLRT_DIR, msize, f"{dstr}_Train*"))
-        model = FFModel.from_path(path)
-        for dpath in tqdm(dpaths, leave=False):
-            results.append(compute(model, dpath))
+    # Read each data file once for every model that uses it.
+    jobs = defaultdict(list)
+    for path in sorted(set(paths)):
+        for dpath in data_paths(path, args.datadir):
+            jobs[dpath].append(path)
+    if args.shard:
+        jobs = shard(jobs, *args.shard)
+        ctx.log.info("shard %d of %d: %d data files", *args.shard, len(jobs))
+    # Load every model before any workers fork so they share its pages.
+    for path in sorted({path for mpaths in jobs.values() for path in mpaths}):
+        MODELS[path] = FFModel.from_path(
+            path, cache_dir=args.model_cache, minimize=args.minimize
+        )
+    # Evaluate the given models, biggest data files first.
+    results, lresults = [], []
+    order = sorted(jobs, key=os.path.getsize, reverse=True)
+    done = run_all([(dpath, jobs[dpath]) for dpath in order], args)
+    for rets, lrets in tqdm(done, total=len(order)):
+        results.extend(rets)
+        lresults.extend(lrets)
+    if not results:
+        ctx.log.info("nothing to evaluate")
+        return
     # Update and write results.
+    now = pd.Timestamp.now()
     new = pd.DataFrame(results)
-    new["last_modified"] = pd.Timestamp.now()
-    if current.empty:
-        current = pd.DataFrame(columns=new.columns)
+    new["last_modified"] = now
     ctx.log.info("writing: %s", args.outpath)
-    update(current, new, on=["model_path", "data_path"]).to_csv(args.outpath, index=False)
+    write_results(args.outpath, new)
+    # Per-length metrics go in their own table (or file next to a CSV).
+    if lresults:
+        lnew = pd.DataFrame(lresults)
+        lnew["last_modified"] = now
+        write_results(args.outpath, lnew, LENGTH_KEYS, table="lengths")
 
 
 if __name__ == "__main__":
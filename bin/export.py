@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Export a results store (e.g. evals.db from eval.py) to CSV.
+
+Example Usage:
+    $ export.py ../FlexFringe/evals.db -o ../FlexFringe/evals.csv
+"""
+import os
+
+from src.core.context import Context
+from src.core.app import harness
+from src.core.store import read_results
+
+
+def main(ctx: Context) -> None:
+    ctx.parser.add_argument("path", help="results store")
+    ctx.parser.add_argument("-o", "--outpath", help="defaults to path with .csv")
+    args = ctx.parser.parse_args()
+    outpath = args.outpath or f"{os.path.splitext(args.path)[0]}.csv"
+    df = read_results(args.path)
+    ctx.log.info("writing %d rows: %s", len(df), outpath)
+    df.to_csv(outpath, index=False)
+
+
+if __name__ == "__main__":
+    harness(main)
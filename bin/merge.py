@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Merge sharded eval.py outputs into one results file.
+
+Rows are deduplicated by model_path and data_path (and length for the
+per-length table), keeping the most recently modified. The merged rows
+replace matching rows in outpath.
+
+Example Usage:
+    $ merge.py ../FlexFringe/evals.*-of-4.db -o ../FlexFringe/evals.db
+"""
+import os
+from contextlib import suppress
+
+import pandas as pd
+
+from src.bin.flexfringe import FF_DIR
+from src.core.context import Context
+from src.core.app import harness
+from src.core.store import read_results, table_path, write_results
+
+
+# The tables eval.py writes and the columns that identify their rows.
+TABLES = {
+    "results": ["model_path", "data_path"],
+    "lengths": ["model_path", "data_path", "length"],
+}
+
+
+def merge(paths: list[str], table: str = "results") -> pd.DataFrame:
+    """Reads result files and keeps the latest row for each key."""
+    keys = TABLES[table]
+    df = pd.concat([read_results(path, table) for path in paths], ignore_index=True)
+    if df.empty:
+        return df
+    return (
+        df.sort_values("last_modified", kind="stable")
+        .drop_duplicates(keys, keep="last")
+        .sort_values(keys)
+        .reset_index(drop=True)
+    )
+
+
+def main(ctx: Context) -> None:
+    ctx.parser.add_argument("paths", nargs="+", help="shard outputs")
+    ctx.parser.add_argument("-o", "--outpath", default=os.path.join(FF_DIR, "evals.db"))
+    ctx.parser.add_argument(
+        "--remove", action="store_true", help="delete shard outputs once merged"
+    )
+    args = ctx.parser.parse_args()
+    ctx.log.info("shard paths: %s", args.paths)
+    ctx.log.info("outpath: %s", args.outpath)
+    for table, keys in TABLES.items():
+        new = merge(args.paths, table)
+        if new.empty:
+            continue
+        ctx.log.info("merged %d %s rows", len(new), table)
+        ctx.log.info("writing: %s", table_path(args.outpath, table))
+        write_results(args.outpath, new, keys, table)
+    if args.remove:
+        for path in args.paths:
+            for table in TABLES:
+                with suppress(FileNotFoundError):
+                    os.remove(table_path(path, table))
+
+
+if __name__ == "__main__":
+    harness(main)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Convert FlexFringe files (text or binary) back to MLRegTest format.
+
+Example Usage:
+    $ rconvert.py ../FlexFringe/data/MLRegTestPS/Small/*_TrainPS.txt -o /path/to/outdir
+    $ rconvert.py ../FlexFringe/data/MLRegTestBin/Large/*.ffb -o /path/to/outdir -e .txt
+"""
+import os
+
+from src.core.context import Context
+from src.core.app import harness
+from src.data.mlrt import MLRegTestFile
+
+
+def main(ctx: Context) -> None:
+    ctx.parser.add_argument("paths", nargs="+", help="flexfringe data paths")
+    ctx.parser.add_argument("-o", "--outdir", required=True)
+    ctx.parser.add_argument("-e", "--ext", default=".mlrt", help="output extension")
+    ctx.parser.add_argument(
+        "-f", "--force", action="store_true", help="overwrite existing"
+    )
+    args = ctx.parser.parse_args()
+
+    os.makedirs(args.outdir, exist_ok=True)
+    for path in args.paths:
+        bname = os.path.splitext(os.path.basename(path))[0]
+        outpath = os.path.join(args.outdir, f"{bname}{args.ext}")
+        if os.path.exists(outpath) and not args.force:
+            continue  # Skip existing files.
+        MLRegTestFile.from_path(path).save_mlrt(outpath)
+        ctx.log.info("wrote: %s", outpath)
+
+
+if __name__ == "__main__":
+    harness(main)
@@ -28,6 +28,7 @@ Note:
     >>> conda install -c conda-forge pynini=2.1.2
 """
 import os
+import tempfile
 from glob import glob
 
 import pynini
@@ -35,6 +36,7 @@ import pandas as pd
 
 from src.core.context import Context
 from src.core.app import harness
+from src.core.functional import atomic_open
 from src.data.flexfringe import FFData
 from src.data.mlrt import MLRT_DIR, MLRegTestFile
 
@@ -183,12 +185,11 @@ def main(ctx: Context) -> None:
         outpath_ff = os.path.join(outdir_os, f"{ltag}_TrainOS.ff")
         if not os.path.exists(outpath_mlrt) or args.force:
             data = get_short_data_from_ltag(ltag)
-            pd.DataFrame(data).to_csv(outpath_mlrt, index=False, header=False, sep="\t")
+            with atomic_open(outpath_mlrt) as fd:
+                pd.DataFrame(data).to_csv(fd, index=False, header=False, sep="\t")
             ctx.log.info("wrote: %s", outpath_mlrt)
         if not os.path.exists(outpath_ff) or args.force:
-            ff_string = MLRegTestFile.from_path(outpath_mlrt).to_string()
-            with open(outpath_ff, "w") as fd:
-                fd.write(ff_string)
+            MLRegTestFile.from_path(outpath_mlrt).save_flexfringe(outpath_ff)
             ctx.log.info("wrote: %s", outpath_ff)
     # Generate OnlyShort compliment classes on second pass.
     for ltag in get_ltags():
@@ -201,13 +202,12 @@ def main(ctx: Context) -> None:
                 inpath := outpath_mlrt.replace(ltag, ltag.replace("co", ""))
             ).to_df().eval("label = not label")
             ctx.log.info("read: %s", inpath)
-            df.to_csv(outpath_mlrt, index=False, header=False, sep="\t")
+            with atomic_open(outpath_mlrt) as fd:
+                df.to_csv(fd, index=False, header=False, sep="\t")
             ctx.log.info("wrote: %s", outpath_mlrt)
         if not os.path.exists(outpath_ff) or args.force:
-            ff_string = MLRegTestFile.from_path(outpath_mlrt).to_string()
+            MLRegTestFile.from_path(outpath_mlrt).save_flexfringe(outpath_ff)
             ctx.log.info("read: %s", outpath_mlrt)
-            with open(outpath_ff, "w") as fd:
-                fd.write(ff_string)
             ctx.log.info("wrote: %s", outpath_ff)
     # Generate PlusShort data (FlexFringe format only).
     for data_size in ("Small", "Mid", "Large"):
@@ -230,10 +230,14 @@ def main(ctx: Context) -> None:
             ).itertuples(index=False, name=None))
             ctx.log.info("read: %s", sh_path)
             data = sh_data + og_data
-            pd.DataFrame(data).to_csv(outpath_ps, index=False, header=False, sep="\t")
-            ff_string = MLRegTestFile.from_path(outpath_ps).to_string()
-            with open(outpath_ps, "w") as fd:
-                fd.write(ff_string)
+            # Stage the MLRegTest version away from the outputs, where a
+            # leftover would match the data globs.
+            with tempfile.TemporaryDirectory() as tmpdir:
+                bname = os.path.basename(outpath_ps)
+                mlrtpath_ps = os.path.join(tmpdir, f"{bname}.mlrt")
+                with atomic_open(mlrtpath_ps) as fd:
+                    pd.DataFrame(data).to_csv(fd, index=False, header=False, sep="\t")
+                MLRegTestFile.from_path(mlrtpath_ps).save_flexfringe(outpath_ps)
             ctx.log.info("wrote: %s", outpath_ps)
 
 
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check that our DFA predictions agree with flexfringe's own (--mode predict).
+
+A sample of models is run on its data both ways: flexfringe in the
+background, one process per group of models with the same data files,
+while the DFA walk runs here. Each model and data file gets a row with
+how often the two disagree and the first few traces where they do.
+
+Example Usage:
+    $ verify.py ../FlexFringe/models/*.final.json -n 20 -w 8
+"""
+import os
+import random
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from src.core.context import Context
+from src.core.app import harness
+from src.core.store import write_results
+from src.bin.flexfringe import FF_DIR
+from src.data.flexfringe import (
+    DATA_CACHE,
+    DATA_CACHE_BYTES,
+    DATA_DIR,
+    MODEL_CACHE_DIR,
+    PREDICT_CACHE_DIR,
+    FFModel,
+    data_paths,
+    predict_batch,
+    predict_many,
+)
+
+
+def compare(
+    model: FFModel,
+    path: str,
+    labels: np.ndarray,
+    ours: np.ndarray,
+    theirs: np.ndarray,
+    num_shown: int = 5,
+) -> dict[str, Any]:
+    """Summarizes where two sets of predictions for one data file differ."""
+    assert len(ours) == len(theirs), f"{path}: {len(ours)} != {len(theirs)}"
+    (idxs,) = np.nonzero(ours != theirs)
+    data = DATA_CACHE.get(path)
+    shown = [
+        " ".join(map(str, seq))
+        for idx in idxs[:num_shown].tolist()
+        for seq in data[idx : idx + 1].sequences()
+    ]
+    return {
+        "model_path": os.path.abspath(model.path),
+        "data_path": os.path.abspath(path),
+        "split": os.path.splitext(os.path.basename(path))[0].split("_")[-1],
+        "num_samples": len(ours),
+        "num_disagree": len(idxs),
+        "disagree_rate": len(idxs) / max(len(ours), 1),
+        "label_mismatch": int((labels != data.labels).sum()),
+        "accuracy": float((ours == labels).mean()) if len(ours) else np.nan,
+        "ff_accuracy": float((theirs == labels).mean()) if len(ours) else np.nan,
+        "first_disagree": list(idxs[:num_shown].tolist()),
+        "first_traces": shown,
+    }
+
+
+def main(ctx: Context) -> None:
+    ctx.parser.add_argument("paths", nargs="+", help="model paths")
+    ctx.parser.add_argument(
+        "-o", "--outpath", default=os.path.join(FF_DIR, "verify.db")
+    )
+    ctx.parser.add_argument(
+        "-d", "--datadir", default=DATA_DIR, help="text or binary (bconvert.py) data"
+    )
+    ctx.parser.add_argument(
+        "-n", "--num-models", type=int, help="check a random sample of the models"
+    )
+    ctx.parser.add_argument("--seed", type=int, default=0)
+    ctx.parser.add_argument(
+        "-w", "--workers", type=int, default=1, help="flexfringe processes at once"
+    )
+    ctx.parser.add_argument(
+        "--show", type=int, default=5, help="mismatching traces kept per row"
+    )
+    ctx.parser.add_argument(
+        "--model-cache", default=MODEL_CACHE_DIR, help="compiled model cache dir"
+    )
+    ctx.parser.add_argument(
+        "--predict-cache", default=PREDICT_CACHE_DIR, help="flexfringe predictions"
+    )
+    ctx.parser.add_argument(
+        "--data-cache",
+        type=int,
+        default=DATA_CACHE_BYTES >> 20,
+        help="MiB of parsed data to keep in memory",
+    )
+    ctx.parser.add_argument(
+        "--no-minimize", dest="minimize", action="store_false", help="skip minimizing"
+    )
+    args = ctx.parser.parse_args()
+    # Parse the given paths or read from file.
+    paths = args.paths
+    if len(args.paths) == 1 and args.paths[0].endswith(".txt"):
+        with open(args.paths[0], "r") as fd:
+            paths = [ln.strip() for ln in fd if ln.strip()]
+    paths = sorted(set(paths))
+    if args.num_models and args.num_models < len(paths):
+        paths = sorted(random.Random(args.seed).sample(paths, args.num_models))
+    ctx.log.info("model paths: %s", paths)
+    ctx.log.info("outpath: %s", args.outpath)
+    DATA_CACHE.max_bytes = args.data_cache << 20
+    # Models with the same data files share a flexfringe batch.
+    groups = defaultdict(list)
+    for path in paths:
+        model = FFModel.from_path(
+            path, cache_dir=args.model_cache, minimize=args.minimize
+        )
+        groups[tuple(data_paths(path, args.datadir))].append(model)
+    # Let flexfringe run in the background while we walk the same models here.
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            dpaths: pool.submit(
+                predict_batch, models, dpaths, 1, args.predict_cache or None
+            )
+            for dpaths, models in groups.items()
+        }
+        results = []
+        for dpaths, models in tqdm(groups.items()):
+            ours = {}
+            for dpath in dpaths:
+                data = DATA_CACHE.get(dpath, trie=True)
+                ours[dpath] = predict_many(models, data, shared_prefixes=True)
+            theirs = futures[dpaths].result()
+            for dpath in dpaths:
+                for model, pred in zip(models, ours[dpath]):
+                    labels, ffpred = theirs[(model.path, dpath)]
+                    ret = compare(model, dpath, labels, pred, ffpred, args.show)
+                    results.append(model.metadata | ret)
+                    if ret["num_disagree"]:
+                        ctx.log.warning(
+                            "%s on %s: %d of %d disagree, e.g. %s",
+                            model.path,
+                            dpath,
+                            ret["num_disagree"],
+                            ret["num_samples"],
+                            ret["first_traces"][:1],
+                        )
+    if not results:
+        ctx.log.info("nothing to verify")
+        return
+    new = pd.DataFrame(results)
+    for col in ["first_disagree", "first_traces"]:
+        new[col] = new[col].map(lambda vals: "; ".join(map(str, vals)))
+    total = new["num_disagree"].sum() / max(new["num_samples"].sum(), 1)
+    ctx.log.info(
+        "%d of %d rows disagree, %.6f of all samples",
+        (new["num_disagree"] > 0).sum(),
+        len(new),
+        total,
+    )
+    new["last_modified"] = pd.Timestamp.now()
+    ctx.log.info("writing: %s", args.outpath)
+    write_results(args.outpath, new)
+
+
+if __name__ == "__main__":
+    harness(main)
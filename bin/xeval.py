@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Exact per-length evaluation of flexfringe models against their target language.
+
+Instead of sampling test strings this counts every string up to a maximum
+length through the product of the model and the target language automaton.
+Counts are stored as decimal text since they soon outgrow SQLite integers.
+
+Example Usage:
+    $ xeval.py ../FlexFringe/models/edsm_04.03.TLT.2.1.0_Small.final.json -n 20
+
+Note:
+    Requires pynini 2.1.2.
+    >>> conda install -c conda-forge pynini=2.1.2
+"""
+import os
+from typing import Any
+
+import pandas as pd
+from tqdm import tqdm
+
+from src.core.context import Context
+from src.core.app import harness
+from src.core.metrics import from_confusion
+from src.core.store import write_results
+from src.bin.flexfringe import FF_DIR
+from src.data.flexfringe import MODEL_CACHE_DIR, FFModel
+from src.data.fst import FST_DIR, read_fst
+
+
+def compute(model: FFModel, max_length: int, exact: bool) -> list[dict[str, Any]]:
+    ltag = os.path.basename(model.path).split("_")[1]
+    target, sigma = read_fst(os.path.join(FST_DIR, f"{ltag}.fst"))
+    counts = model.compiled.confusion_by_length(target, sigma, max_length, exact)
+    rets = []
+    for length, ((tn, fp), (fn, tp)) in enumerate(counts.tolist()):
+        tn, fp, fn, tp = (int(count) for count in (tn, fp, fn, tp))
+        ret = model.metadata
+        ret["length"] = length
+        ret |= {"tn": str(tn), "fp": str(fp), "fn": str(fn), "tp": str(tp)}
+        ret |= from_confusion([[tn, fp], [fn, tp]])
+        ret["model_path"] = os.path.abspath(model.path)
+        rets.append(ret)
+    return rets
+
+
+def main(ctx: Context) -> None:
+    ctx.parser.add_argument("paths", nargs="+", help="model paths")
+    ctx.parser.add_argument(
+        "-o", "--outpath", default=os.path.join(FF_DIR, "exact-evals.db")
+    )
+    ctx.parser.add_argument("-n", "--max-length", type=int, default=50)
+    ctx.parser.add_argument(
+        "--float",
+        dest="exact",
+        action="store_false",
+        help="count with floats, only while len(sigma)**max_length <= 2**53",
+    )
+    ctx.parser.add_argument(
+        "--model-cache", default=MODEL_CACHE_DIR, help="compiled model cache dir"
+    )
+    args = ctx.parser.parse_args()
+    ctx.log.info("model paths: %s", args.paths)
+    ctx.log.info("outpath: %s", args.outpath)
+    # Evaluate the given models.
+    results = []
+    for path in tqdm(args.paths):
+        assert path.endswith(".final.json")
+        model = FFModel.from_path(path, cache_dir=args.model_cache, minimize=True)
+        results.extend(compute(model, args.max_length, args.exact))
+    # Update and write results.
+    new = pd.DataFrame(results)
+    new["last_modified"] = pd.Timestamp.now()
+    ctx.log.info("writing: %s", args.outpath)
+    write_results(args.outpath, new, ["model_path", "length"])
+
+
+if __name__ == "__main__":
+    harness(main)
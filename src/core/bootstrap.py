@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*
+"""
+Bootstrap confidence intervals for binary classification metrics.
+
+Every resample is reduced to a confusion matrix, so all the metrics of all
+the resamples are computed at once with array operations.
+"""
+import numpy as np
+
+
+METRICS = ("accuracy", "f1")
+
+
+def resample_counts(
+    counts: np.ndarray, num_resamples: int = 1000, seed: int = 0
+) -> np.ndarray:
+    """
+    Resamples a dataset with replacement from its confusion counts alone.
+
+    Drawing samples with replacement only matters through how many land in
+    each cell, which is multinomial, so the per-sample outcomes are not
+    needed and this costs nothing per sample.
+
+    Args:
+        counts: A (2, 2) array of counts indexed by [label, pred].
+        num_resamples: How many resamples to draw.
+        seed: Seeds the random generator so intervals are reproducible.
+
+    Returns:
+        A (num_resamples, 2, 2) array of confusion counts.
+    """
+    counts = np.asarray(counts, dtype=np.int64).ravel()
+    total = int(counts.sum())
+    if not total:
+        return np.zeros((num_resamples, 2, 2), dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    draws = rng.multinomial(total, counts / total, size=num_resamples)
+    return draws.reshape(num_resamples, 2, 2)
+
+
+def scores(counts: np.ndarray) -> dict[str, np.ndarray]:
+    """Computes METRICS for every confusion matrix in a (..., 2, 2) array."""
+    counts = np.asarray(counts, dtype=np.float64)
+    tn, fp = counts[..., 0, 0], counts[..., 0, 1]
+    fn, tp = counts[..., 1, 0], counts[..., 1, 1]
+    total, f1_denom = tn + fp + fn + tp, 2 * tp + fp + fn
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "accuracy": np.where(total > 0, (tp + tn) / total, 0.0),
+            "f1": np.where(tp > 0, 2 * tp / f1_denom, 0.0),
+        }
+
+
+def intervals(resampled: np.ndarray, confidence: float = 0.95) -> dict[str, float]:
+    """
+    Percentile intervals from resampled confusion counts.
+
+    Args:
+        resampled: A (num_resamples, 2, 2) array from resample_counts().
+        confidence: The coverage of each interval.
+
+    Returns:
+        <metric>_lo and <metric>_hi for each of METRICS.
+    """
+    alpha = (1 - confidence) / 2
+    ret = {}
+    for metric, vals in scores(resampled).items():
+        lo, hi = np.quantile(vals, [alpha, 1 - alpha])
+        ret[f"{metric}_lo"], ret[f"{metric}_hi"] = float(lo), float(hi)
+    return ret
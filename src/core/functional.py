@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-from typing import Any, Callable, Iterable, Iterator, TypeVar, Union
+from contextlib import contextmanager
+from typing import IO, Any, Callable, Iterable, Iterator, TypeVar, Union
+import hashlib
 import os
 import shelve
+import tempfile
 
 
 def safe_iter(arg: Union[Any, Iterable[Any]]) -> Iterable[Any]:
@@ -62,6 +65,63 @@ def save_iter(itr: Iterable[Any], path: str, mode: str = "w") -> None:
                 fd.write("\n" + str(line))
 
 
+def _read_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Reading the umask means briefly setting it for the whole process, which
+# is only safe before any threads start, so it is read once on import.
+UMASK = _read_umask()
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = "w", **kwargs: Any) -> Iterator[IO[Any]]:
+    """
+    Opens a temporary file that replaces path only once it is closed cleanly.
+
+    Interrupted writes never leave a partial file at path, so checks like
+    os.path.exists(path) can trust whatever they find there.
+
+    Args:
+        path (str): The final path.
+        mode (str): A write mode for open().
+
+    Yields:
+        The open temporary file.
+    """
+    outdir = os.path.dirname(os.path.abspath(path))
+    os.makedirs(outdir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=outdir, prefix=f".{os.path.basename(path)}.")
+    try:
+        with open(fd, mode, **kwargs) as fobj:
+            yield fobj
+        os.chmod(tmp, 0o666 & ~UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def sha1sum(path: str, chunk_size: int = 2**24) -> str:
+    """
+    Hashes the contents of a file without reading it all into memory.
+
+    Args:
+        path (str): The file to hash.
+        chunk_size (int): How many bytes to read at a time.
+
+    Returns:
+        The hex digest.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as fd:
+        while block := fd.read(chunk_size):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
 class Filter:
     def __init__(self, fn: Callable[..., bool]):
         self.fn = fn
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*
+"""
+Binary classification metrics computed from a confusion matrix.
+
+These match the evaluate (scikit-learn) metrics of the same names with
+zero_division=0, but are computed in a single pass with no module loading
+or cache files.
+"""
+from typing import Optional
+
+import numpy as np
+
+
+KEYS = ("accuracy", "precision", "recall", "f1", "brier_score")
+
+
+def confusion(
+    labels: np.ndarray, preds: np.ndarray, groups: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Counts each pair of label and prediction.
+
+    Args:
+        labels: The true labels (0 or 1).
+        preds: The predicted labels (0 or 1), optionally with leading
+            dimensions, e.g. one row per model.
+        groups: A non-negative group for each sample, e.g. its length, to
+            count separately.
+
+    Returns:
+        A (..., 2, 2) array of counts indexed by [..., label, pred], or
+        (..., num_groups, 2, 2) if groups are given.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    preds = np.asarray(preds, dtype=np.int64)
+    assert labels.shape == preds.shape[-1:]
+    lead = preds.shape[:-1]
+    rows = np.arange(int(np.prod(lead))).reshape(lead + (1,))
+    if groups is None:
+        idx = 4 * rows + 2 * labels + preds
+        return np.bincount(idx.ravel(), minlength=4 * rows.size).reshape(lead + (2, 2))
+    groups = np.asarray(groups, dtype=np.int64)
+    num_groups = int(groups.max(initial=-1)) + 1
+    idx = 4 * (rows * num_groups + groups) + 2 * labels + preds
+    counts = np.bincount(idx.ravel(), minlength=4 * rows.size * num_groups)
+    return counts.reshape(lead + (num_groups, 2, 2))
+
+
+def from_confusion(
+    counts: np.ndarray, brier_sum: Optional[float] = None
+) -> dict[str, float]:
+    """
+    Computes every metric from confusion counts.
+
+    Args:
+        counts: A (2, 2) array indexed by [label, pred].
+        brier_sum: The summed squared error of the predicted probabilities.
+            Hard predictions are assumed if it is not given.
+
+    Returns:
+        Each metric in KEYS.
+    """
+    (tn, fp), (fn, tp) = np.asarray(counts).tolist()
+    total = tn + fp + fn + tp
+    if brier_sum is None:
+        brier_sum = fp + fn
+    return {
+        "accuracy": (tp + tn) / total if total else 0.0,
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "f1": 2 * tp / (2 * tp + fp + fn) if tp else 0.0,
+        "brier_score": brier_sum / total if total else 0.0,
+    }
+
+
+def compute(
+    labels: np.ndarray, preds: np.ndarray, probs: Optional[np.ndarray] = None
+) -> dict[str, float]:
+    """
+    Computes every metric from labels and predictions.
+
+    Args:
+        labels: The true labels (0 or 1).
+        preds: The predicted labels (0 or 1).
+        probs: The predicted probability of 1, if there is one.
+
+    Returns:
+        Each metric in KEYS.
+    """
+    brier_sum = None
+    if probs is not None:
+        brier_sum = float(np.square(np.asarray(probs) - labels).sum())
+    return from_confusion(confusion(labels, preds), brier_sum)
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*
+"""
+A results table that rows can be upserted into without rewriting it.
+
+Results are kept in SQLite keyed on a set of columns. Writers take the
+database lock for the length of one upsert, so parallel jobs can share a
+file and each write costs the same however many rows are already stored.
+Paths that do not end in a database extension fall back to rewriting a
+CSV with core.df.update.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+from contextlib import suppress
+from typing import Any, Sequence
+
+from pandas import DataFrame  # type: ignore
+import pandas as pd  # type: ignore
+
+from .df import update
+
+
+DB_EXTS = (".db", ".sqlite")
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+class ResultStore:
+    def __init__(
+        self,
+        path: str,
+        keys: Sequence[str] = ("model_path", "data_path"),
+        table: str = "results",
+        timeout: float = 600.0,
+    ):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.keys = list(keys)
+        self.table = table
+        # Rollback journaling since WAL needs shared memory, which network
+        # filesystems do not provide. Writers wait up to timeout for the lock.
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+
+    def __enter__(self) -> ResultStore:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def columns(self) -> list[str]:
+        rows = self.conn.execute(f"PRAGMA table_info({_quote(self.table)})")
+        return [row[1] for row in rows]
+
+    def upsert(self, df: DataFrame) -> None:
+        """
+        Inserts rows, replacing any stored rows with the same keys.
+
+        Columns the table does not have yet are added to it.
+
+        Args:
+            df: The rows, which must have every key column.
+        """
+        assert set(self.keys) <= set(df.columns)
+        df = df.copy()
+        for col in df.select_dtypes(include=["datetime", "datetimetz"]).columns:
+            df[col] = df[col].astype(str)
+        cols = list(df.columns)
+        rows = zip(*(df[col].tolist() for col in cols))
+        table, keys = _quote(self.table), ", ".join(map(_quote, self.keys))
+        names = ", ".join(map(_quote, cols))
+        updates = ", ".join(f"{_quote(c)} = excluded.{_quote(c)}" for c in cols)
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ({keys}, PRIMARY KEY ({keys}))"
+            )
+            current = set(self.columns())
+            for col in cols:
+                if col not in current:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {_quote(col)}")
+            self.conn.executemany(
+                f"INSERT INTO {table} ({names}) VALUES ({', '.join('?' * len(cols))})"
+                f" ON CONFLICT ({keys}) DO UPDATE SET {updates}",
+                rows,
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def read(self) -> DataFrame:
+        if not self.columns():
+            return DataFrame()
+        return pd.read_sql_query(f"SELECT * FROM {_quote(self.table)}", self.conn)
+
+    def to_csv(self, path: str) -> None:
+        self.read().to_csv(path, index=False)
+
+
+def is_store(path: str) -> bool:
+    return os.path.splitext(path)[1] in DB_EXTS
+
+
+def table_path(path: str, table: str) -> str:
+    """Where a CSV keeps a table other than results, e.g. evals.lengths.csv."""
+    if table == "results" or is_store(path):
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{table}{ext}"
+
+
+def read_results(path: str, table: str = "results") -> DataFrame:
+    """Reads every row from a store or CSV, which may not exist yet."""
+    if is_store(path):
+        if not os.path.exists(path):
+            return DataFrame()
+        with ResultStore(path, table=table) as store:
+            return store.read()
+    with suppress(FileNotFoundError):
+        return pd.read_csv(table_path(path, table))
+    return DataFrame()
+
+
+def write_results(
+    path: str,
+    df: DataFrame,
+    keys: Sequence[str] = ("model_path", "data_path"),
+    table: str = "results",
+) -> None:
+    """
+    Upserts rows into a store, or rewrites a CSV with them merged in.
+
+    Args:
+        path: A store (see DB_EXTS) or CSV path.
+        df: The rows to write.
+        keys: The columns that identify a row.
+        table: Which table of the store to write to. Other tables of a CSV
+            are kept in files next to it (see table_path).
+    """
+    if is_store(path):
+        with ResultStore(path, keys, table) as store:
+            store.upsert(df)
+        return
+    current = read_results(path, table)
+    path = table_path(path, table)
+    if current.empty:
+        current = DataFrame(columns=df.columns)
+    # update() needs matching columns but new runs may add some, e.g. --bootstrap.
+    cols = list(current.columns) + [c for c in df.columns if c not in current]
+    current, df = current.reindex(columns=cols), df.reindex(columns=cols)
+    update(current, df, on=list(keys)).to_csv(path, index=False)
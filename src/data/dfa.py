@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, Optional, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .trie import PrefixTrie
+
+
+def pack(seqs: Sequence[Sequence[int]]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Packs sequences into compressed sparse row (CSR) form.
+
+    Args:
+        seqs: The sequences.
+
+    Returns:
+        Offsets such that sequence i is symbols[offsets[i]:offsets[i + 1]] and
+        the symbols of every sequence laid end to end.
+    """
+    lengths = np.fromiter(map(len, seqs), dtype=np.int64, count=len(seqs))
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    symbols = np.fromiter(
+        (sym for seq in seqs for sym in seq), dtype=np.int64, count=offsets[-1]
+    )
+    return offsets, symbols
+
+
+@dataclass
+class DFA:
+    """
+    A deterministic automaton stored as a dense integer transition table.
+
+    State 0 is the start state and the last state is a sink that every missing
+    edge points to. The last column of the table is reserved for symbols that
+    never appear on an edge so they lead to the sink as well.
+    """
+
+    delta: np.ndarray  # (num_states, num_symbols + 1) int32
+    accept: np.ndarray  # (num_states,) bool
+
+    @classmethod
+    def from_edges(
+        cls,
+        edges: Iterable[tuple[int, int, int]],
+        accepting: Iterable[int],
+        num_states: int,
+        num_symbols: int,
+    ) -> DFA:
+        """
+        Builds a table from (source, symbol, target) triples.
+
+        Args:
+            edges: Transitions between states numbered 0 to num_states - 1.
+            accepting: The accepting states.
+            num_states: The number of states not counting the sink.
+            num_symbols: The number of symbols not counting the unknown column.
+
+        Returns:
+            The compiled automaton.
+        """
+        sink = num_states
+        delta = np.full((num_states + 1, num_symbols + 1), sink, dtype=np.int32)
+        for src, sym, tgt in edges:
+            delta[src, sym] = tgt
+        accept = np.zeros(num_states + 1, dtype=bool)
+        accept[list(accepting)] = True
+        return cls(delta=delta, accept=accept)
+
+    @classmethod
+    def load(cls, path: str) -> DFA:
+        """Memory-maps a table written by DFA.save so processes share pages."""
+        return cls(
+            delta=np.load(os.path.join(path, "delta.npy"), mmap_mode="r"),
+            accept=np.load(os.path.join(path, "accept.npy"), mmap_mode="r"),
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "delta.npy"), self.delta)
+        np.save(os.path.join(path, "accept.npy"), self.accept)
+
+    @property
+    def sink(self) -> int:
+        return len(self.accept) - 1
+
+    @property
+    def num_symbols(self) -> int:
+        return int(self.delta.shape[1]) - 1
+
+    def __call__(self, seq: Sequence[int]) -> bool:
+        return bool(self.run([seq])[0])
+
+    def encode(self, syms: np.ndarray) -> np.ndarray:
+        """Maps symbols the automaton has never seen to the unknown column."""
+        return np.minimum(syms, self.num_symbols)
+
+    def run(self, seqs: Sequence[Sequence[int]]) -> np.ndarray:
+        """
+        Steps every sequence forward together one position at a time.
+
+        Args:
+            seqs: The sequences to classify.
+
+        Returns:
+            A boolean array with whether each sequence is accepted.
+        """
+        return self.walk(*pack(seqs))
+
+    def walk(
+        self,
+        offsets: np.ndarray,
+        symbols: np.ndarray,
+        starts: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        Runs the automaton over sequences in CSR form (see pack()).
+
+        A sequence leaves the working set as soon as it has been read to the
+        end or every automaton has fallen into a trap, so each step only costs
+        as much as the number of sequences that are still undecided.
+
+        Args:
+            offsets: Where each sequence starts in symbols, plus the end.
+            symbols: The symbols of every sequence laid end to end.
+            starts: Start states to run from, one row of output per start.
+
+        Returns:
+            A boolean array with whether each sequence is accepted.
+        """
+        traps = self.traps()
+        lengths = np.diff(offsets)
+        shape = (1 if starts is None else len(starts), len(lengths))
+        states = np.zeros(shape, dtype=np.int32)
+        states[:] = 0 if starts is None else starts[:, None]
+        rows = np.arange(len(lengths))
+        ret = np.empty(states.shape, dtype=bool)
+        for pos in range(int(lengths.max(initial=0)) + 1):
+            done = (lengths[rows] <= pos) | traps[states].all(axis=0)
+            ret[:, rows[done]] = self.accept[states[:, done]]
+            rows, states = rows[~done], states[:, ~done]
+            if not len(rows):
+                break
+            states = self.delta[states, self.encode(symbols[offsets[rows] + pos])]
+        return ret[0] if starts is None else ret
+
+    def walk_trie(
+        self, trie: PrefixTrie, starts: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Runs the automaton over every prefix in a trie exactly once.
+
+        Only the states of one depth are kept at a time so memory is bounded
+        by the widest level of the trie rather than its size. The walk stops
+        once every automaton is trapped at every node of a level.
+
+        Args:
+            trie: The prefixes of the sequences to classify.
+            starts: Start states to run from, one row of output per start.
+
+        Returns:
+            A boolean array with whether each sequence in the trie is accepted.
+        """
+        traps = self.traps()
+        syms = self.encode(trie.symbol)
+        # Group sequences by the depth of the node they end at.
+        order = np.argsort(trie.leaves, kind="stable")
+        bounds = np.searchsorted(trie.leaves[order], trie.offsets)
+        states = np.zeros((1 if starts is None else len(starts), 1), np.int32)
+        states[:] = 0 if starts is None else starts[:, None]
+        ret = np.zeros((len(states), len(order)), dtype=bool)
+        for depth in range(len(trie.offsets) - 1):
+            if depth > 0:
+                lvl = slice(trie.offsets[depth], trie.offsets[depth + 1])
+                parent = trie.parent[lvl] - trie.offsets[depth - 1]
+                states = self.delta[states[:, parent], syms[lvl]]
+            idx = order[bounds[depth] : bounds[depth + 1]]
+            ret[:, idx] = self.accept[states[:, trie.leaves[idx] - trie.offsets[depth]]]
+            if traps[states].all():
+                break  # Everything deeper is rejected.
+        return ret[0] if starts is None else ret
+
+    def traps(self) -> np.ndarray:
+        """
+        Finds rejecting states that every symbol loops back to.
+
+        The sink is always one and after minimize() it is the only one.
+
+        Returns:
+            A boolean mask over states.
+        """
+        loops = (self.delta == np.arange(len(self.delta))[:, None]).all(axis=1)
+        return np.asarray(loops & ~self.accept)
+
+    def reachable(self) -> np.ndarray:
+        """Returns a mask of the states that can be reached from the start."""
+        seen = np.zeros(len(self.accept), dtype=bool)
+        seen[0] = True
+        frontier = np.array([0])
+        while len(frontier):
+            frontier = np.unique(self.delta[frontier])
+            frontier = frontier[~seen[frontier]]
+            seen[frontier] = True
+        return seen
+
+    def live(self) -> np.ndarray:
+        """Returns a mask of the states that can reach an accepting state."""
+        # Index the predecessors of each state by sorting edges on their target.
+        srcs = np.repeat(np.arange(len(self.delta)), self.delta.shape[1])
+        order = np.argsort(self.delta.reshape(-1), kind="stable")
+        srcs = srcs[order]
+        bounds = np.searchsorted(
+            self.delta.reshape(-1)[order], np.arange(len(self.delta) + 1)
+        )
+        seen = np.array(self.accept, dtype=bool)
+        frontier = np.flatnonzero(seen)
+        while len(frontier):
+            sizes = bounds[frontier + 1] - bounds[frontier]
+            firsts = np.repeat(bounds[frontier] - np.cumsum(sizes) + sizes, sizes)
+            frontier = np.unique(srcs[firsts + np.arange(sizes.sum())])
+            frontier = frontier[~seen[frontier]]
+            seen[frontier] = True
+        return seen
+
+    def minimize(self) -> tuple[DFA, np.ndarray]:
+        """
+        Builds the smallest automaton that accepts the same language.
+
+        Unreachable states are dropped and every state that cannot reach an
+        accepting state is merged into the sink. The remaining states are
+        split by vectorized partition refinement, with each round grouping
+        states by their own block and the blocks of their successors, until
+        no block splits. States are then numbered breadth first from the
+        start so that states visited together sit close together in memory.
+
+        Returns:
+            The minimal automaton and the new state of each old state, or -1
+            for states that were unreachable.
+        """
+        keep = self.reachable()
+        keep[self.sink] = True
+        ids = np.flatnonzero(keep)
+        remap = np.full(len(keep), -1, dtype=np.int64)
+        remap[ids] = np.arange(len(ids))
+        delta = remap[self.delta[ids]]
+        # Dead states are all equivalent since they only lead to dead states.
+        blocks = np.where(self.live()[ids], 1 + self.accept[ids], 0)
+        num_blocks = len(np.unique(blocks))
+        while True:
+            sig = np.column_stack([blocks, blocks[delta]])
+            _, blocks = np.unique(sig, axis=0, return_inverse=True)
+            blocks = blocks.reshape(-1)
+            if blocks.max() + 1 == num_blocks:
+                break
+            num_blocks = blocks.max() + 1
+        # Number blocks breadth first with the dead block last.
+        reps = np.unique(blocks, return_index=True)[1]
+        quotient = blocks[delta[reps]]
+        dead = blocks[remap[self.sink]]
+        levels = [np.array([blocks[0]])]
+        seen = np.zeros(num_blocks, dtype=bool)
+        seen[[blocks[0], dead]] = True
+        while len(levels[-1]):
+            frontier = np.unique(quotient[levels[-1]])
+            levels.append(frontier[~seen[frontier]])
+            seen[levels[-1]] = True
+        if blocks[0] != dead:
+            levels.append(np.array([dead]))
+        order = np.concatenate(levels)
+        number = np.empty(num_blocks, dtype=np.int64)
+        number[order] = np.arange(len(order))
+        mapping = np.full(len(keep), -1, dtype=np.int64)
+        mapping[ids] = number[blocks]
+        return (
+            DFA(
+                delta=number[quotient[order]].astype(np.int32),
+                accept=np.array(self.accept[ids[reps[order]]], dtype=bool),
+            ),
+            mapping,
+        )
+
+    @classmethod
+    def stack(cls, dfas: Sequence[DFA]) -> tuple[DFA, np.ndarray]:
+        """
+        Combines automata into one table so they can be walked together.
+
+        Args:
+            dfas: The automata.
+
+        Returns:
+            The combined automaton and the start state of each input.
+        """
+        sizes = np.array([len(dfa.accept) for dfa in dfas], dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        width = max(dfa.num_symbols for dfa in dfas)
+        # Symbols an automaton has never seen still lead to its own sink.
+        delta = np.repeat(starts + sizes - 1, sizes)[:, None].repeat(width + 1, 1)
+        for dfa, start in zip(dfas, starts):
+            rows = slice(start, start + len(dfa.accept))
+            delta[rows, : dfa.num_symbols] = dfa.delta[:, : dfa.num_symbols] + start
+        return (
+            cls(
+                delta=delta.astype(np.int32),
+                accept=np.concatenate([dfa.accept for dfa in dfas]),
+            ),
+            starts,
+        )
+
+    def confusion_by_length(
+        self,
+        target: DFA,
+        sigma: np.ndarray,
+        max_length: int,
+        exact: bool = True,
+    ) -> np.ndarray:
+        """
+        Counts how every string up to a length is labeled by two automata.
+
+        This walks the reachable part of the product automaton and pushes
+        the number of strings that arrive at each product state forward one
+        length at a time, so no strings are ever enumerated.
+
+        Args:
+            target: The automaton giving the true labels.
+            sigma: The symbols strings are drawn from.
+            max_length: The longest strings to count.
+            exact: Count with python integers instead of floats. Floats are
+                much faster but are only allowed while every count fits in
+                2**53, where they are still exact.
+
+        Returns:
+            A (max_length + 1, 2, 2) array where [n, t, p] is the number of
+            strings of length n that target labels t and this labels p.
+        """
+        if not exact and len(sigma) ** max_length > 2**53:
+            raise ValueError(
+                f"{len(sigma)}**{max_length} strings overflow float counts, use exact"
+            )
+        mine, theirs = self.encode(sigma), target.encode(sigma)
+        # Find the reachable pairs of states, encoded as mine * width + theirs.
+        width = len(target.accept)
+        pairs = frontier = np.array([0], dtype=np.int64)
+        while len(frontier):
+            nxt = self.delta[frontier[:, None] // width, mine] * width
+            nxt = nxt + target.delta[frontier[:, None] % width, theirs]
+            frontier = np.setdiff1d(nxt, pairs)
+            pairs = np.union1d(pairs, frontier)
+        succ = self.delta[pairs[:, None] // width, mine] * width
+        succ = succ + target.delta[pairs[:, None] % width, theirs]
+        succ = np.searchsorted(pairs, succ)
+        cells = 2 * target.accept[pairs % width] + self.accept[pairs // width]
+        ret = np.zeros((max_length + 1, 4), dtype=object if exact else np.float64)
+        counts = np.zeros(len(pairs), dtype=ret.dtype)
+        counts[np.searchsorted(pairs, 0)] = 1
+        for length in range(max_length + 1):
+            if exact:
+                np.add.at(ret[length], cells, counts)
+                nxt = np.zeros(len(pairs), dtype=object)
+                np.add.at(nxt, succ.reshape(-1), np.repeat(counts, len(sigma)))
+            else:
+                ret[length] = np.bincount(cells, weights=counts, minlength=4)
+                nxt = np.bincount(
+                    succ.reshape(-1),
+                    weights=np.repeat(counts, len(sigma)),
+                    minlength=len(pairs),
+                )
+            counts = nxt
+        return ret.reshape(-1, 2, 2)
@@ -1,20 +1,41 @@
 # -*- coding: utf-8 -*
 from __future__ import annotations
 
+import dataclasses
+import functools
+import glob
+import hashlib
 import json
 import os
+import shutil
 import subprocess
 import sys
-from collections import defaultdict
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 from dataclasses import dataclass
-from typing import Any, Iterator
+from typing import Any, Iterator, Optional, Sequence
 
+import numpy as np
 import pandas as pd  # type: ignore
+from more_itertools import chunked
 
 from ..bin.flexfringe import FF_BIN, FF_DIR
+from ..core.functional import UMASK, atomic_open, sha1sum
+from .dfa import DFA, pack
+from .trie import PrefixTrie
 
 
 PROBABALISTIC_INIS = ["alergia"]
+CHUNK_SIZE = 2**16  # Samples read at a time when streaming.
+CHUNK_BYTES = 2**24  # Bytes parsed at a time when streaming columns.
+BINARY_MAGIC = b"FFBIN\x00\x00\x01"  # Also encodes the format version.
+MODEL_CACHE_DIR = os.path.join(os.path.dirname(FF_DIR), ".cache", "models")
+PREDICT_CACHE_DIR = os.path.join(os.path.dirname(FF_DIR), ".cache", "predictions")
+PREDICT_INI = os.path.join(FF_DIR, "ini", "likelihood.ini")
+DATA_DIR = os.path.join(FF_DIR, "data", "MLRegTest")  # Converted MLRegTest.
+DATA_CACHE_BYTES = 2**31  # Parsed datasets kept in memory per process.
 
 
 @dataclass
@@ -25,15 +46,373 @@ class FFData:
 
     @classmethod
     def from_path(cls, path: str) -> FFData:
-        samples = []
+        return cls(
+            path=path, header=cls.read_header(path), samples=list(cls.iter_path(path))
+        )
+
+    @staticmethod
+    def read_header(path: str) -> list[int]:
+        with open(path, "r") as fd:
+            return list(map(int, next(fd).strip().split()))
+
+    @staticmethod
+    def iter_path(path: str) -> Iterator[tuple[int, int, list[int]]]:
+        """
+        Yields samples one at a time as the file is read.
+
+        The sample count in the header is only checked once the whole file
+        has been read.
+
+        Args:
+            path: A path to a flexfringe (abbadingo) format file.
+
+        Yields:
+            (label, length, sequence) tuples.
+        """
+        count = 0
         with open(path, "r") as fd:
             header = list(map(int, next(fd).strip().split()))
             for ln in fd:
                 line = list(map(int, ln.strip().split()))
                 assert line[1] == len(line[2:])
-                samples.append((line[0], line[1], line[2:]))
-            assert header[0] == len(samples)
-            return cls(path=path, header=header, samples=samples)
+                count += 1
+                yield line[0], line[1], line[2:]
+        assert header[0] == count
+
+    @classmethod
+    def iter_chunks(cls, path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[FFData]:
+        """
+        Reads a file in pieces so it never has to be held in memory at once.
+
+        Args:
+            path: A path to a flexfringe (abbadingo) format file.
+            chunk_size: The number of samples in each piece.
+
+        Yields:
+            Datasets that share the header of the whole file.
+        """
+        header = cls.read_header(path)
+        for chunk in chunked(cls.iter_path(path), chunk_size):
+            yield cls(path=path, header=header, samples=chunk)
+
+    @functools.cached_property
+    def columns(self) -> FFColumns:
+        return FFColumns.from_samples(self.path, self.header, self.samples)
+
+    def write_binary(self, path: str) -> None:
+        self.columns.write_binary(path)
+
+
+# Every symbol as " <decimal>", left aligned in a fixed width row.
+_TOKEN_CHARS = np.array(
+    [list(f" {n:<3}".encode("ascii")) for n in range(256)], dtype=np.uint8
+)
+_TOKEN_WIDTHS = np.array([len(f" {n}") for n in range(256)])
+
+
+def is_binary(path: str) -> bool:
+    with open(path, "rb") as fd:
+        return fd.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+def _parse_ints(raw: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Parses whitespace separated non-negative integers in bulk.
+
+    Args:
+        raw: Text containing only digits and whitespace.
+
+    Returns:
+        The value of every integer and the line it was found on.
+    """
+    buf = np.frombuffer(raw, dtype=np.uint8)
+    digit = (buf >= ord("0")) & (buf <= ord("9"))
+    space = (buf == ord(" ")) | (buf == ord("\n")) | (buf == ord("\t"))
+    assert (digit | space | (buf == ord("\r"))).all()
+    bounds = np.flatnonzero(np.diff(digit.view(np.int8), prepend=0, append=0))
+    starts, ends = bounds[::2], bounds[1::2]
+    # Accumulate one digit position at a time; numbers here are short.
+    values = np.zeros(len(starts), dtype=np.int64)
+    last = len(buf) - 1
+    for pos in range(int((ends - starts).max(initial=0))):
+        at = starts + pos
+        shifted = values * 10 + buf[np.minimum(at, last)] - ord("0")
+        values = np.where(at < ends, shifted, values)
+    lines = np.searchsorted(np.flatnonzero(buf == ord("\n")), starts)
+    return values, lines
+
+
+@dataclass
+class FFColumns:
+    """
+    A flexfringe dataset stored column by column.
+
+    Sample i is labels[i] with symbols[offsets[i]:offsets[i + 1]], the
+    compressed sparse row (CSR) layout that the DFA walkers read directly.
+    """
+
+    path: str
+    header: list[int]
+    labels: np.ndarray  # (num_samples,) bool
+    offsets: np.ndarray  # (num_samples + 1,) int64
+    symbols: np.ndarray  # (num_symbols,) uint8
+
+    @classmethod
+    def from_path(cls, path: str) -> FFColumns:
+        """Reads either a flexfringe (abbadingo) text file or a binary trace."""
+        if is_binary(path):
+            return cls.from_binary(path)
+        with open(path, "rb") as fd:
+            header = list(map(int, fd.readline().split()))
+            ret = cls.from_bytes(path, header, fd.read())
+        assert header[0] == len(ret)
+        return ret
+
+    @classmethod
+    def from_binary(cls, path: str) -> FFColumns:
+        """
+        Memory-maps a binary trace without copying any of it.
+
+        Layout (little endian):
+            magic (8 bytes), alphabet size, sample count and symbol count
+            (uint64 each), labels (uint8, zero padded to a multiple of 8),
+            offsets (int64, one more than the sample count) and symbols (uint8).
+
+        Args:
+            path: A path written by FFColumns.write_binary.
+
+        Returns:
+            The samples as read-only views of the file.
+        """
+        buf = np.memmap(path, dtype=np.uint8, mode="r")
+        assert bytes(buf[: len(BINARY_MAGIC)]) == BINARY_MAGIC
+        alphabet_size, num_samples, num_symbols = buf[8:32].view("<u8").tolist()
+        start = 32 + -(-num_samples // 8) * 8
+        end = start + 8 * (num_samples + 1)
+        return cls(
+            path=path,
+            header=[num_samples, alphabet_size],
+            labels=buf[32 : 32 + num_samples].view(bool),
+            offsets=buf[start:end].view("<i8"),
+            symbols=buf[end : end + num_symbols],
+        )
+
+    def write_binary(self, path: str) -> None:
+        """Writes the samples in the format read by FFColumns.from_binary."""
+        num_samples, alphabet_size = self.header
+        assert num_samples == len(self)
+        pad = -num_samples % 8
+        with atomic_open(path, "wb") as fd:
+            fd.write(BINARY_MAGIC)
+            fd.write(np.array([alphabet_size, num_samples, len(self.symbols)], "<u8"))
+            fd.write(np.concatenate([self.labels, np.zeros(pad)]).astype(np.uint8))
+            fd.write(np.asarray(self.offsets - self.offsets[0], dtype="<i8"))
+            fd.write(np.asarray(self.symbols, dtype=np.uint8))
+
+    @classmethod
+    def iter_chunks(
+        cls, path: str, chunk_bytes: int = CHUNK_BYTES
+    ) -> Iterator[FFColumns]:
+        """
+        Reads a file in pieces of whole lines so memory use stays bounded.
+
+        Args:
+            path: A path to a flexfringe (abbadingo) format file.
+            chunk_bytes: Roughly how much of the file to parse at a time.
+
+        Yields:
+            Datasets that share the header of the whole file.
+        """
+        if is_binary(path):
+            data = cls.from_binary(path)
+            # Cut between samples so each piece has about chunk_bytes symbols.
+            cuts = np.searchsorted(
+                data.offsets, np.arange(0, data.offsets[-1], chunk_bytes), "right"
+            )
+            cuts = np.unique(np.concatenate([[0], cuts - 1, [len(data)]]))
+            for lo, hi in zip(cuts[:-1], cuts[1:]):
+                yield data[lo:hi]
+            return
+        count = 0
+        with open(path, "rb") as fd:
+            header = list(map(int, fd.readline().split()))
+            rest = b""
+            while block := fd.read(chunk_bytes):
+                raw, _, rest = (rest + block).rpartition(b"\n")
+                if raw:
+                    count += len(chunk := cls.from_bytes(path, header, raw))
+                    yield chunk
+            if rest.strip():
+                count += len(chunk := cls.from_bytes(path, header, rest))
+                yield chunk
+        assert header[0] == count
+
+    @classmethod
+    def from_bytes(cls, path: str, header: list[int], raw: bytes) -> FFColumns:
+        """
+        Parses sample lines (everything after the header) with NumPy.
+
+        Args:
+            path: Where the lines came from.
+            header: The file header.
+            raw: One or more complete sample lines.
+
+        Returns:
+            The samples.
+        """
+        values, lines = _parse_ints(raw)
+        # The first two numbers on each line are its label and length.
+        firsts = np.flatnonzero(np.diff(lines, prepend=-1))
+        counts = np.diff(firsts, append=len(values))
+        labels, lengths = values[firsts], values[firsts + 1]
+        assert np.isin(labels, (0, 1)).all()
+        assert (counts == lengths + 2).all()
+        rank = np.arange(len(values)) - np.repeat(firsts, counts)
+        symbols = values[rank >= 2]
+        assert symbols.max(initial=0) < 256
+        return cls(
+            path=path,
+            header=header,
+            labels=labels.astype(bool),
+            offsets=np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            symbols=symbols.astype(np.uint8),
+        )
+
+    @classmethod
+    def from_samples(
+        cls, path: str, header: list[int], samples: Sequence[tuple[int, int, list[int]]]
+    ) -> FFColumns:
+        offsets, symbols = pack([seq for _, _, seq in samples])
+        labels = np.array([label for label, _, _ in samples], dtype=np.int64)
+        assert np.isin(labels, (0, 1)).all()
+        return cls(
+            path=path,
+            header=header,
+            labels=labels.astype(bool),
+            offsets=offsets,
+            symbols=symbols.astype(np.uint8),
+        )
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __getitem__(self, idx: slice) -> FFColumns:
+        """Takes a contiguous range of samples, sharing the symbol array."""
+        lo, hi, step = idx.indices(len(self))
+        assert step == 1
+        offsets = self.offsets[lo : max(lo, hi) + 1]
+        return FFColumns(
+            path=self.path,
+            header=self.header,
+            labels=self.labels[lo:hi],
+            offsets=offsets - offsets[0],
+            symbols=self.symbols[offsets[0] : offsets[-1]],
+        )
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def to_text(self) -> str:
+        """
+        Formats the samples as flexfringe lines, without the header.
+
+        Symbols are rendered for the whole dataset at once from a table of
+        their decimal forms; only the label and length go through Python.
+
+        Returns:
+            The sample lines joined by newlines.
+        """
+        widths = _TOKEN_WIDTHS[self.symbols]
+        mask = np.arange(_TOKEN_CHARS.shape[1]) < widths[:, None]
+        text = _TOKEN_CHARS[self.symbols][mask].tobytes().decode("ascii")
+        ends = np.concatenate([[0], np.cumsum(widths)])[self.offsets]
+        return "\n".join(
+            f"{label} {length}{text[start:end]}"
+            for label, length, start, end in zip(
+                self.labels.astype(int).tolist(),
+                self.lengths.tolist(),
+                ends[:-1].tolist(),
+                ends[1:].tolist(),
+            )
+        )
+
+    @functools.cached_property
+    def trie(self) -> PrefixTrie:
+        """The shared prefixes of every sample, built once per dataset."""
+        return PrefixTrie.from_csr(self.offsets, self.symbols)
+
+    def sequences(self) -> Iterator[list[int]]:
+        for start, end in zip(self.offsets[:-1], self.offsets[1:]):
+            yield self.symbols[start:end].tolist()
+
+
+class DataCache:
+    """
+    A least recently used cache of parsed datasets with a byte budget.
+
+    Entries are keyed by absolute path, modification time and size so a
+    rewritten file is parsed again. Only worth it when files are read
+    again, e.g. verify.py, since eval.py streams each one once.
+    """
+
+    def __init__(self, max_bytes: int = DATA_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[tuple[str, int, int], FFColumns] = OrderedDict()
+
+    @staticmethod
+    def _key(path: str) -> tuple[str, int, int]:
+        stat = os.stat(path)
+        return os.path.abspath(path), stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _size(data: FFColumns) -> int:
+        arrays = [data.labels, data.offsets, data.symbols]
+        # The trie is a cached_property so it is only counted once it is built.
+        if (trie := data.__dict__.get("trie")) is not None:
+            arrays += [trie.parent, trie.symbol, trie.offsets, trie.leaves]
+        return sum(arr.nbytes for arr in arrays)
+
+    def get(self, path: str, trie: bool = False) -> FFColumns:
+        """
+        Reads a whole dataset, parsing it only if it is not cached.
+
+        Args:
+            path: A path to a flexfringe (abbadingo) format file.
+            trie: Also build its prefix trie so the budget includes it.
+
+        Returns:
+            The dataset.
+        """
+        key = self._key(path)
+        if key in self._data:
+            self.hits += 1
+            self._data.move_to_end(key)
+            data = self._data[key]
+        else:
+            self.misses += 1
+            data = self._data[key] = FFColumns.from_path(path)
+        if trie:
+            data.trie  # pylint: disable=pointless-statement
+        # Sizes change as tries are built so recount instead of tracking.
+        self.nbytes = sum(map(self._size, self._data.values()))
+        while self.nbytes > self.max_bytes and self._data:
+            _, old = self._data.popitem(last=False)
+            self.nbytes -= self._size(old)
+        return data
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.nbytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+DATA_CACHE = DataCache()
 
 
 @dataclass
@@ -43,11 +422,43 @@ class FFModelResult:
     pred: bool
 
 
+def _cache_key(path: str) -> str:
+    """Identifies a file by its absolute path and when it was last modified."""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _prune_machine(obj: dict[str, Any]) -> Any:
+    """A json object hook that keeps only edges, node ids, and final counts."""
+    if "source" in obj and "target" in obj:
+        return (int(obj["source"]), int(obj["name"]), int(obj["target"]))
+    if "id" in obj and "data" in obj:
+        return (int(obj["id"]), obj["data"].get("final_counts"))
+    return obj
+
+
 @dataclass
 class FFModel:
+    __slots__ = (
+        "path",
+        "compiled",
+        "final_counts",
+        "parsed_states",
+        "ini",
+        "data_size",
+        "alphabet_size",
+        "tier_size",
+        "language_class",
+        "factor_width",
+        "threshold",
+        "index",
+    )
+
     path: str
-    machine: dict[str, Any]
-    dfa: dict[str, dict[str, Any]]
+    compiled: DFA
+    final_counts: np.ndarray  # (num_states, 2) counts of [bad, good] traces.
+    parsed_states: int  # Number of states before minimize().
     ini: str  # E.g. esdm
     data_size: str  # Small, Mid, Large
     alphabet_size: int  # 4, 16, 64
@@ -58,36 +469,96 @@ class FFModel:
     index: int
 
     @classmethod
-    def from_path(cls, path: str) -> FFModel:
-        ini = os.path.basename(path).split("_")[
-            0
-        ]  # XXX: Code repetition here... clean up.
+    def from_path(
+        cls, path: str, cache_dir: Optional[str] = None, minimize: bool = False
+    ) -> FFModel:
+        """
+        Reads a flexfringe model.
+
+        Args:
+            path: A path to a *.final.json file.
+            cache_dir: If given, compiled arrays are memory-mapped from here
+                when the model has not changed since they were written and
+                are saved here otherwise.
+            minimize: Return the minimal equivalent model.
+
+        Returns:
+            The model.
+        """
+        if cache_dir:
+            key = _cache_key(path) + ("-min" if minimize else "")
+            cpath = os.path.join(cache_dir, key)
+            # Missing, unreadable and half-written entries are all misses.
+            with suppress(OSError, ValueError):
+                return cls._load(path, cpath)
+        model = cls._from_arrays(path, *cls._parse(path))
+        if minimize:
+            model = model.minimize()
+        if cache_dir:
+            model.save(cpath)
+        return model
+
+    @classmethod
+    def _load(cls, path: str, cpath: str) -> FFModel:
+        with open(os.path.join(cpath, "meta.json"), "r") as fd:
+            parsed_states = json.load(fd)["parsed_states"]
+        return cls._from_arrays(
+            path,
+            DFA.load(cpath),
+            np.load(os.path.join(cpath, "final_counts.npy"), mmap_mode="r"),
+            parsed_states,
+        )
+
+    @classmethod
+    def _parse(cls, path: str) -> tuple[DFA, np.ndarray]:
+        bname = os.path.basename(path)
+        ini = bname.split("_")[0]
+        alphabet_size = int(bname.split("_")[1].split(".")[0])
         with open(path, "r") as fd:
-            machine = json.load(fd)
-        # {src1: {inp1: tgt1, ..., is_final: True/False}, ...}
-        dfa: dict[str, dict[str, Any]] = defaultdict(dict)
-        # dfa[start_state][input] = end_state
-        for edge in machine["edges"]:
-            dfa[edge["source"]][edge["name"]] = edge["target"]
-        # dfa[state_id]["is_final"] = True/False
+            machine = json.load(fd, object_hook=_prune_machine)
         assert set(machine["types"]) == {"0", "1"}
         bad, good = machine["types"]
-        for node in machine["nodes"]:
+        # Number states so the start state 0 comes first and the sink last.
+        ids = sorted(nid for nid, _ in machine["nodes"])
+        assert ids and ids[0] == 0
+        index = {nid: idx for idx, nid in enumerate(ids)}
+        final_counts = np.zeros((len(ids) + 1, 2), dtype=np.int64)
+        for nid, fcnts in machine["nodes"]:
             if ini in PROBABALISTIC_INIS:
-                fcnts = {"0": 0, "1": 0} | node["data"].get("final_counts", {})
-                dfa[str(node["id"])]["is_final"] = fcnts[good] > fcnts[bad]
+                fcnts = {"0": 0, "1": 0} | (fcnts or {})
             else:
-                fcnts = {"0": 0, "1": 0} | node["data"]["final_counts"]
+                fcnts = {"0": 0, "1": 0} | fcnts
                 assert not (fcnts[bad] > 0 and fcnts[good] > 0)
-                dfa[str(node["id"])]["is_final"] = fcnts[good] > 0
             assert set(fcnts.keys()) == {"0", "1"}
-        # assign metadata
+            final_counts[index[nid]] = fcnts[bad], fcnts[good]
+        if ini in PROBABALISTIC_INIS:
+            accept = final_counts[:, 1] > final_counts[:, 0]
+        else:
+            accept = final_counts[:, 1] > 0
+        edges = [(index[src], sym, index[tgt]) for src, sym, tgt in machine["edges"]]
+        compiled = DFA.from_edges(
+            edges,
+            accepting=np.flatnonzero(accept),
+            num_states=len(ids),
+            num_symbols=max([alphabet_size] + [sym + 1 for _, sym, _ in edges]),
+        )
+        return compiled, final_counts
+
+    @classmethod
+    def _from_arrays(
+        cls,
+        path: str,
+        compiled: DFA,
+        final_counts: np.ndarray,
+        parsed_states: Optional[int] = None,
+    ) -> FFModel:
         bname = os.path.basename(path)
         mdata = bname.split("_")[1].split(".")
         return cls(
             path=path,
-            machine=machine,
-            dfa=dfa,
+            compiled=compiled,
+            final_counts=final_counts,
+            parsed_states=parsed_states or len(compiled.accept) - 1,
             ini=bname.split("_")[0],
             data_size=bname.split("_")[-1].split(".")[0],
             alphabet_size=int(mdata[0]),
@@ -98,19 +569,89 @@ class FFModel:
             index=int(mdata[5]),
         )
 
+    def save(self, path: str) -> None:
+        """Atomically writes the compiled arrays to a cache directory."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            self.compiled.save(tmpdir)
+            np.save(os.path.join(tmpdir, "final_counts.npy"), self.final_counts)
+            with open(os.path.join(tmpdir, "meta.json"), "w") as fd:
+                json.dump(
+                    {
+                        "source": os.path.abspath(self.path),
+                        "parsed_states": self.parsed_states,
+                    }
+                    | self.metadata,
+                    fd,
+                )
+            # mkdtemp makes it 0700 but the cache is shared with the group.
+            os.chmod(tmpdir, 0o777 & ~UMASK)
+            os.rename(tmpdir, path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+            # Another process wrote the same entry first.
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    @property
+    def machine(self) -> dict[str, Any]:
+        """The full flexfringe output, re-read from disk on every access."""
+        with open(self.path, "r") as fd:
+            return dict(json.load(fd))
+
+    @property
+    def metadata(self) -> dict[str, Any]:
+        """Everything but the path and the automaton itself."""
+        skip = ("path", "compiled", "final_counts", "parsed_states")
+        return {k: getattr(self, k) for k in self.__slots__ if k not in skip}
+
+    @property
+    def num_states(self) -> int:
+        """The number of states not counting the sink."""
+        return len(self.compiled.accept) - 1
+
+    def minimize(self) -> FFModel:
+        """
+        Returns the minimal equivalent model.
+
+        The final counts of merged states are summed. The number of states
+        before minimizing is kept in parsed_states.
+        """
+        compiled, mapping = self.compiled.minimize()
+        final_counts = np.zeros((len(compiled.accept), 2), dtype=np.int64)
+        kept = mapping >= 0
+        np.add.at(final_counts, mapping[kept], self.final_counts[kept])
+        return dataclasses.replace(self, compiled=compiled, final_counts=final_counts)
+
     def __call__(self, seq: list[int]) -> bool:
-        state = "0"
-        for sym in seq:
-            state = self.dfa[state].get(str(sym), None)
-            if state is None:
-                return False
-        assert isinstance(self.dfa[state]["is_final"], bool)
-        return bool(self.dfa[state]["is_final"])
-
-    def evaluate(self, path: str) -> Iterator[FFModelResult]:
-        for label, _, seq in FFData.from_path(path).samples:
-            assert label in (0, 1)
-            yield FFModelResult(seq, bool(label), self(seq))
+        return self.compiled(seq)
+
+    def predict(self, data: FFColumns, shared_prefixes: bool = False) -> np.ndarray:
+        """
+        Classifies every sample in a dataset.
+
+        Args:
+            data: The dataset.
+            shared_prefixes: Walk the dataset's prefix trie so that each
+                prefix is only stepped through once.
+
+        Returns:
+            A boolean array of predictions.
+        """
+        if shared_prefixes:
+            return self.compiled.walk_trie(data.trie)
+        return self.compiled.walk(data.offsets, data.symbols)
+
+    def evaluate(
+        self, path: str, shared_prefixes: bool = False
+    ) -> Iterator[FFModelResult]:
+        """Per-sample results, which keep a copy of every sequence."""
+        for data in FFColumns.iter_chunks(path):
+            preds = self.predict(data, shared_prefixes=shared_prefixes)
+            for seq, label, pred in zip(data.sequences(), data.labels, preds):
+                yield FFModelResult(seq, bool(label), bool(pred))
 
     def results(self, path: str) -> Iterator[FFModelResult]:
         _, dstr, _ = os.path.basename(self.path).replace(".final.json", "").split("_")
@@ -123,10 +664,9 @@ class FFModel:
             rdir, f"{self.ini}-{self.data_size}_{dstr}_{dsize}-{split}.result"
         )
         os.makedirs(rdir, exist_ok=True)
-        inipath = os.path.join(FF_DIR, "ini", "likelihood.ini")
         cmd = [
             f"{FF_BIN} {path} --aptafile {self.path} "
-            f"--ini {inipath} --mode predict --predicttype 1; "
+            f"--ini {PREDICT_INI} --mode predict --predicttype 1; "
             f"mv {self.path}.result {rpath}"
         ]
         subprocess.run(
@@ -142,3 +682,172 @@ class FFModel:
                 label=row[" trace type"],
                 pred=row[" predicted trace type"],
             )
+
+
+def data_paths(path: str, datadir: str = DATA_DIR) -> list[str]:
+    """
+    The data files a model is evaluated on.
+
+    Always the large test sets, plus the training set of the model's own
+    size as a sanity check.
+
+    Args:
+        path: A path to a *.final.json file.
+        datadir: Where the flexfringe (text or binary) data lives.
+
+    Returns:
+        The sorted data paths.
+    """
+    assert path.endswith(".final.json")
+    _, dstr, msize = os.path.basename(path).replace(".final.json", "").split("_")
+    dpaths = glob.glob(os.path.join(datadir, "Large", f"{dstr}_Test*"))
+    dpaths += glob.glob(os.path.join(datadir, msize, f"{dstr}_Train*"))
+    return sorted(dpaths)
+
+
+def predict_many(
+    models: Sequence[FFModel], data: FFColumns, shared_prefixes: bool = True
+) -> np.ndarray:
+    """
+    Classifies every sample in a dataset with several models at once.
+
+    Args:
+        models: The models, typically all trained on the same language.
+        data: The dataset.
+        shared_prefixes: Walk the dataset's prefix trie.
+
+    Returns:
+        A (num_models, num_samples) boolean array of predictions.
+    """
+    stacked, starts = DFA.stack([model.compiled for model in models])
+    if shared_prefixes:
+        return stacked.walk_trie(data.trie, starts=starts)
+    return stacked.walk(data.offsets, data.symbols, starts=starts)
+
+
+def read_predictions(path: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reads the labels and predictions of a flexfringe predict .result file.
+
+    Only those two columns are parsed, so the traces and score sequences
+    never become Python objects.
+
+    Args:
+        path: A .result file from flexfringe --mode predict.
+
+    Returns:
+        Boolean arrays of the labels and the predictions.
+    """
+    cols = {"trace type": "label", "predicted trace type": "pred"}
+    df = pd.read_csv(
+        path,
+        sep=";",
+        usecols=lambda col: str(col).strip() in cols,
+        skipinitialspace=True,
+    )
+    df = df.rename(columns=lambda col: cols[str(col).strip()])
+    return df["label"].to_numpy(dtype=bool), df["pred"].to_numpy(dtype=bool)
+
+
+def _concat(paths: Sequence[str], outpath: str) -> list[int]:
+    """Writes several data files as one flexfringe file and returns their sizes."""
+    headers = [
+        FFColumns.from_binary(path).header
+        if is_binary(path)
+        else FFData.read_header(path)
+        for path in paths
+    ]
+    with open(outpath, "w") as fd:
+        fd.write(f"{sum(h[0] for h in headers)} {max(h[1] for h in headers)}")
+        for path in paths:
+            for chunk in FFColumns.iter_chunks(path):
+                if len(chunk):
+                    fd.write("\n" + chunk.to_text())
+    return [header[0] for header in headers]
+
+
+def _predict_file(model: FFModel, paths: Sequence[str]) -> list[tuple[np.ndarray, ...]]:
+    """Runs one flexfringe predict over every data file at once."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        datapath = os.path.join(tmpdir, "data.txt")
+        sizes = _concat(paths, datapath)
+        # flexfringe writes <aptafile>.result so keep it out of the model dir.
+        aptapath = os.path.join(tmpdir, os.path.basename(model.path))
+        os.symlink(os.path.abspath(model.path), aptapath)
+        subprocess.run(
+            [
+                FF_BIN,
+                datapath,
+                "--aptafile",
+                aptapath,
+                "--ini",
+                PREDICT_INI,
+                "--mode",
+                "predict",
+                "--predicttype",
+                "1",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=sys.stderr,
+            check=True,
+        )
+        labels, preds = read_predictions(f"{aptapath}.result")
+    assert len(labels) == sum(sizes)
+    cuts = np.cumsum(sizes)[:-1]
+    return list(zip(np.split(labels, cuts), np.split(preds, cuts)))
+
+
+def predict_batch(
+    models: Sequence[FFModel],
+    paths: Sequence[str],
+    workers: Optional[int] = None,
+    cache_dir: Optional[str] = PREDICT_CACHE_DIR,
+) -> dict[tuple[str, str], tuple[np.ndarray, np.ndarray]]:
+    """
+    Classifies data files with flexfringe itself (the "sicco method").
+
+    Each model gets a single flexfringe process over all the data files it
+    has no cached predictions for, and the processes run concurrently.
+
+    Args:
+        models: The models.
+        paths: The data files to predict for every model.
+        workers: How many flexfringe processes to run at once.
+        cache_dir: Where predictions are kept, keyed by the hashes of the
+            model and data files. Nothing is cached if it is None.
+
+    Returns:
+        The labels and predictions, keyed by model path and data path.
+    """
+    digest = functools.lru_cache(maxsize=None)(sha1sum)
+
+    def cpath(model: FFModel, path: str) -> str:
+        key = f"{digest(model.path)}-{digest(path)}"
+        return os.path.join(cache_dir or "", f"{key}.npz")
+
+    def run(model: FFModel) -> dict[tuple[str, str], tuple[np.ndarray, np.ndarray]]:
+        ret: dict[tuple[str, str], tuple[np.ndarray, np.ndarray]] = {}
+        todo = []
+        for path in paths:
+            if cache_dir and os.path.exists(cpath(model, path)):
+                with np.load(cpath(model, path)) as npz:
+                    ret[(model.path, path)] = (npz["labels"], npz["preds"])
+            else:
+                todo.append(path)
+        if not todo:
+            return ret
+        for path, (labels, preds) in zip(todo, _predict_file(model, todo)):
+            ret[(model.path, path)] = (labels, preds)
+            if cache_dir:
+                with atomic_open(cpath(model, path), "wb") as fd:
+                    np.savez(fd, labels=labels, preds=preds)
+        return ret
+
+    # Hash everything up front so threads never race on the memo.
+    for path in [model.path for model in models] + list(paths):
+        digest(path)
+    ret: dict[tuple[str, str], tuple[np.ndarray, np.ndarray]] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for part in pool.map(run, models):
+            ret |= part
+    return ret
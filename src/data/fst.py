@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*
+"""
+Target language automata.
+
+Note:
+    Requires pynini 2.1.2.
+    >>> conda install -c conda-forge pynini=2.1.2
+"""
+from __future__ import annotations
+
+import os
+
+import numpy as np
+
+from .dfa import DFA
+from .mlrt import validate_alphabet
+
+
+SRL_DIR = "/gpfs/projects/HeinzGroup/subregular-learning/"
+FST_DIR = os.path.join(SRL_DIR, "src", "fstlib", "fst_format")
+
+
+def read_fst(path: str) -> tuple[DFA, np.ndarray]:
+    """
+    Reads a target language acceptor as a DFA over flexfringe symbols.
+
+    Characters are numbered the same way MLRegTestFile.to_flexfringe numbers
+    them so the result can be compared directly with an FFModel. The
+    alphabet is taken from the MLRegTest data rather than the arcs since
+    minimizing drops letters that only lead to rejection.
+
+    Args:
+        path: A path to an .fst file, e.g. os.path.join(FST_DIR, f"{ltag}.fst").
+
+    Returns:
+        The automaton and the sorted symbols of the language's alphabet.
+    """
+    import pynini  # pylint: disable=import-error,import-outside-toplevel
+
+    fst = pynini.determinize(pynini.Fst.read(path).rmepsilon()).minimize()
+    table = fst.input_symbols()
+    alphabet = validate_alphabet(64)
+    alphabet_size = int(os.path.basename(path).split(".")[0])
+    sigma = np.array(sorted(map(alphabet.index, validate_alphabet(alphabet_size))))
+    zero = pynini.Weight.zero(fst.weight_type())  # type: ignore[attr-defined]
+    # Number states so the start state comes first.
+    ids = sorted(fst.states(), key=lambda s: (s != fst.start(), s))
+    index = {sid: idx for idx, sid in enumerate(ids)}
+    edges = []
+    for sid in ids:
+        for arc in fst.arcs(sid):
+            char = table.find(arc.ilabel) if table else chr(arc.ilabel)
+            edges.append((index[sid], alphabet.index(char), index[arc.nextstate]))
+    dfa = DFA.from_edges(
+        edges,
+        accepting=[index[sid] for sid in ids if fst.final(sid) != zero],
+        num_states=len(ids),
+        num_symbols=len(alphabet),
+    )
+    return dfa, sigma
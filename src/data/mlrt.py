@@ -3,24 +3,143 @@ from __future__ import annotations
 
 import functools
 import glob
+import io
+import json
 import os
+from collections import defaultdict
+from contextlib import suppress
 from dataclasses import dataclass
-from typing import Any
+from typing import IO, Any, Iterator
 
+import numpy as np
 import pandas as pd  # type: ignore
 
+from ..bin.flexfringe import FF_DIR
+from ..core.functional import atomic_open
+from .flexfringe import CHUNK_BYTES, CHUNK_SIZE, FFColumns, FFData, is_binary
+
 
 MLRT_DIR = "/gpfs/projects/HeinzGroup/subregular-learning/data_gen/"
+ALPHABET_INDEX = os.path.join(os.path.dirname(FF_DIR), ".cache", "alphabets.json")
+
+
+def _index_stamp() -> dict[str, Any]:
+    """Identifies the state of the directory the alphabets are read from."""
+    root = os.path.abspath(os.path.join(MLRT_DIR, "Small"))
+    return {"root": root, "mtime_ns": os.stat(root).st_mtime_ns}
+
+
+def build_alphabet_index(path: str = ALPHABET_INDEX) -> dict[int, list[str]]:
+    """
+    Scans every Small file for the symbols of each alphabet size.
+
+    The result is written atomically to path along with a stamp of the
+    directory it was read from so later processes can tell if it is stale.
+
+    Args:
+        path: Where to write the index.
+
+    Returns:
+        The sorted symbols of each alphabet size.
+    """
+    stamp = _index_stamp()
+    symbols: defaultdict[int, set[str]] = defaultdict(set)
+    for fpath in glob.glob(os.path.join(stamp["root"], "*")):
+        mfile = MLRegTestFile.from_path(fpath)
+        symbols[mfile.alphabet_size] |= set("".join(mfile.to_df()["sample"]))
+    alphabets = {
+        size: sorted(syms, key=lambda s: (not s.isascii(), not s.islower(), s))
+        for size, syms in sorted(symbols.items())
+    }
+    with atomic_open(path, "w", encoding="utf-8") as fd:
+        json.dump(stamp | {"alphabets": alphabets}, fd, ensure_ascii=False)
+    return alphabets
+
+
+def read_alphabet_index(path: str = ALPHABET_INDEX) -> dict[int, list[str]]:
+    """Reads the alphabet index, rebuilding it if the corpus has changed."""
+    with suppress(FileNotFoundError, ValueError, KeyError):
+        with open(path, "r", encoding="utf-8") as fd:
+            index = json.load(fd)
+        if index["root"] == (stamp := _index_stamp())["root"] and (
+            index["mtime_ns"] == stamp["mtime_ns"]
+        ):
+            return {int(size): syms for size, syms in index["alphabets"].items()}
+    return build_alphabet_index(path)
 
 
 @functools.lru_cache
 def validate_alphabet(alphabet_size: int) -> list[str]:
-    alphabet = set()
-    for path in glob.glob(os.path.join(MLRT_DIR, "Small", f"{alphabet_size}.*")):
-        df = MLRegTestFile.from_path(path).to_df()
-        alphabet |= set("".join(df["sample"]))
+    alphabet = read_alphabet_index().get(alphabet_size, [])
     assert alphabet_size == len(alphabet)
-    return sorted(list(alphabet), key=lambda s: (not s.isascii(), not s.islower(), s))
+    return alphabet
+
+
+@functools.lru_cache
+def symbol_table() -> tuple[np.ndarray, np.ndarray]:
+    """
+    Looks up flexfringe symbols by code point.
+
+    Returns:
+        The sorted code points of the 64 symbol alphabet and, for each one,
+        its index in validate_alphabet(64).
+    """
+    points = np.array([ord(s) for s in validate_alphabet(64)], dtype=np.uint32)
+    order = np.argsort(points)
+    return points[order], order.astype(np.uint8)
+
+
+def encode(samples: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes a column of strings as flexfringe symbols all at once.
+
+    Args:
+        samples: MLRegTest strings.
+
+    Returns:
+        Where each string starts in the symbols, plus the end, and the
+        symbols of every string laid end to end.
+    """
+    points, index = symbol_table()
+    text = "".join(samples).encode("utf-32-le")
+    chars = np.frombuffer(text, dtype="<u4")
+    pos = np.minimum(np.searchsorted(points, chars), len(points) - 1)
+    assert (points[pos] == chars).all(), "symbol outside the alphabet"
+    lengths = samples.str.len().to_numpy(dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    assert offsets[-1] == len(chars)
+    return offsets, index[pos]
+
+
+def _count_lines(path: str) -> int:
+    """Counts the lines of a file without decoding it."""
+    count, last = 0, b"\n"
+    with open(path, "rb") as fd:
+        while block := fd.read(CHUNK_BYTES):
+            count += block.count(b"\n")
+            last = block[-1:]
+    # The last line may not end in a newline.
+    return count + (last != b"\n")
+
+
+def decode(offsets: np.ndarray, symbols: np.ndarray) -> list[str]:
+    """
+    Turns flexfringe symbols back into MLRegTest strings all at once.
+
+    Args:
+        offsets: Where each string starts in symbols, plus the end.
+        symbols: The symbols of every string laid end to end.
+
+    Returns:
+        The strings.
+    """
+    points, index = symbol_table()
+    chars = np.empty(len(points), dtype="<u4")
+    chars[index] = points
+    assert symbols.max(initial=0) < len(chars), "symbol outside the alphabet"
+    text = chars[symbols].tobytes().decode("utf-32-le")
+    bounds = (offsets - offsets[0]).tolist()
+    return [text[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
 
 
 @dataclass
@@ -39,8 +158,11 @@ class MLRegTestFile:
     @classmethod
     def from_path(cls, path: str) -> MLRegTestFile:
         # TODO: This is a weak way to check format.
-        with open(path, "r") as fd:
-            file_format = "mlrt" if "\t" in next(fd) else "ff"
+        if is_binary(path):
+            file_format = "ff"
+        else:
+            with open(path, "r") as fd:
+                file_format = "mlrt" if "\t" in next(fd) else "ff"
         bname = os.path.basename(path)
         mdata = bname.split("_")[0].split(".")
         return cls(
@@ -57,47 +179,140 @@ class MLRegTestFile:
         )
 
     def to_string(self) -> str:
-        lines = []
-        header, samples = self.to_flexfringe()
-        lines.append(" ".join(map(str, header)))
-        for smpl in samples:
-            lines.append(" ".join(map(str, [smpl[0], smpl[1]] + smpl[2])))
-        return "\n".join(lines)
+        buf = io.StringIO()
+        self.write_flexfringe(buf)
+        return buf.getvalue()
+
+    def write_flexfringe(self, fd: IO[str], chunk_size: int = CHUNK_SIZE) -> None:
+        """
+        Writes the file in flexfringe format a chunk of samples at a time.
+
+        Args:
+            fd: A text file to write to.
+            chunk_size: How many samples to encode and write at once.
+        """
+        header = self.read_header()
+        fd.write(" ".join(map(str, header)))
+        count = 0
+        for chunk in self._chunks(header, chunk_size):
+            if len(chunk):
+                fd.write("\n" + chunk.to_text())
+                count += len(chunk)
+        assert header[0] == count
+
+    def save_flexfringe(self, path: str, chunk_size: int = CHUNK_SIZE) -> None:
+        """Atomically writes the file in flexfringe format to path."""
+        with atomic_open(path, "w") as fd:
+            self.write_flexfringe(fd, chunk_size)
+
+    def read_header(self) -> list[int]:
+        """The flexfringe header, without reading any samples."""
+        if self.file_format == "ff" and is_binary(self.path):
+            return FFColumns.from_binary(self.path).header
+        if self.file_format == "ff":
+            return FFData.read_header(self.path)
+        return [_count_lines(self.path), self.alphabet_size]
+
+    def iter_columns(self, chunk_size: int = CHUNK_SIZE) -> Iterator[FFColumns]:
+        """
+        Reads and encodes the samples a chunk at a time.
+
+        Args:
+            chunk_size: How many MLRegTest samples to read at once.
+
+        Yields:
+            Datasets that share the header of the whole file.
+        """
+        return self._chunks(self.read_header(), chunk_size)
+
+    def _chunks(self, header: list[int], chunk_size: int) -> Iterator[FFColumns]:
+        if self.file_format == "ff":
+            yield from FFColumns.iter_chunks(self.path)
+            return
+        for df in self.iter_df(chunk_size):
+            yield self._encode(df, header)
+
+    def to_columns(self) -> FFColumns:
+        if self.file_format == "ff":
+            return FFColumns.from_path(self.path)
+        df = self.to_df()
+        return self._encode(df, [len(df), self.alphabet_size])
+
+    def _encode(self, df: pd.DataFrame, header: list[int]) -> FFColumns:
+        offsets, symbols = encode(df["sample"].astype(str))
+        labels = df["label"].to_numpy()
+        assert np.isin(labels, (0, 1)).all()
+        return FFColumns(
+            path=self.path,
+            header=header,
+            labels=labels.astype(bool),
+            offsets=offsets,
+            symbols=symbols,
+        )
+
+    def write_binary(self, path: str) -> None:
+        """Writes a binary trace that FFColumns.from_path memory-maps."""
+        self.to_columns().write_binary(path)
 
     def to_flexfringe(self) -> tuple[list[Any], list[Any]]:
         # TODO: validate small, mid, large have 1k, 10k, and 100k samples.
-        alphabet = validate_alphabet(64)
-        df = self.to_df()
-        header = [len(df), self.alphabet_size]
-        samples = []
-        for dct in df.to_dict("records"):
-            smpl = list(map(lambda s: alphabet.index(s), dct["sample"]))
-            assert len(smpl) == len(dct["sample"])
-            samples.append((int(dct["label"]), len(smpl), smpl))
-        return header, samples
+        data = self.to_columns()
+        samples = [
+            (int(label), len(seq), seq)
+            for label, seq in zip(data.labels.tolist(), data.sequences())
+        ]
+        return data.header, samples
 
-    # XXX: currently unused.
     def to_mlrt(self) -> tuple[list[Any], list[Any]]:
-        assert self.file_format == "ff"
-        alphabet = validate_alphabet(64)
         samples = []
-        with open(self.path, "r") as fd:
-            lines = tuple(
-                map(lambda s: tuple(map(int, s.split(" "))), fd.read().split("\n"))
-            )
-        num_lines, alphabet_size = lines[0]
-        assert num_lines == len(lines) - 1
-        assert alphabet_size == self.alphabet_size
-        for line in lines[1:]:
-            label = line[0]
-            length, smpl = line[1], "".join(map(lambda n: alphabet[n], line[2:]))
-            assert label in (0, 1)
-            assert length == len(smpl)
-            samples.append([smpl, str(bool(label)).upper()])
+        for chunk in self._ff_chunks():
+            smpls = decode(chunk.offsets, chunk.symbols)
+            for smpl, label in zip(smpls, chunk.labels.tolist()):
+                samples.append([smpl, "TRUE" if label else "FALSE"])
         return [], samples
 
+    def _ff_chunks(self) -> Iterator[FFColumns]:
+        assert self.file_format == "ff"
+        for chunk in FFColumns.iter_chunks(self.path):
+            assert chunk.header[1] == self.alphabet_size
+            yield chunk
+
+    def write_mlrt(self, fd: IO[str]) -> None:
+        """
+        Writes a flexfringe file in MLRegTest format a chunk at a time.
+
+        Args:
+            fd: A text file to write to.
+        """
+        for chunk in self._ff_chunks():
+            labels = np.array(["FALSE\n", "TRUE\n"])[chunk.labels.astype(int)]
+            fd.write(
+                "".join(
+                    f"{smpl}\t{label}"
+                    for smpl, label in zip(
+                        decode(chunk.offsets, chunk.symbols), labels.tolist()
+                    )
+                )
+            )
+
+    def save_mlrt(self, path: str) -> None:
+        """Atomically writes the file in MLRegTest format to path."""
+        with atomic_open(path, "w", encoding="utf-8") as fd:
+            self.write_mlrt(fd)
+
     def to_df(self) -> pd.DataFrame:
         assert self.file_format == "mlrt"
         return pd.read_csv(
             self.path, sep="\t", names=["sample", "label"], keep_default_na=False
         )
+
+    def iter_df(self, chunk_size: int = CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+        """Same as to_df() but reads chunk_size samples at a time."""
+        assert self.file_format == "mlrt"
+        yield from pd.read_csv(
+            self.path,
+            sep="\t",
+            names=["sample", "label"],
+            keep_default_na=False,
+            chunksize=chunk_size,
+        )
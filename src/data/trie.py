@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Sequence
+
+import numpy as np
+
+from .dfa import pack
+
+
+@dataclass
+class PrefixTrie:
+    """
+    Every distinct prefix of a set of sequences, stored level by level.
+
+    Node 0 is the empty prefix. The nodes at depth d are numbered from
+    offsets[d] to offsets[d + 1] - 1 and each one extends its parent by a
+    single symbol, so a walk only needs one gather per level.
+    """
+
+    parent: np.ndarray  # (num_nodes,) parent node, -1 for the root.
+    symbol: np.ndarray  # (num_nodes,) symbol on the edge from the parent.
+    offsets: np.ndarray  # (max_length + 2,) first node at each depth.
+    leaves: np.ndarray  # (num_seqs,) node each sequence ends at.
+
+    @classmethod
+    def from_samples(cls, seqs: Sequence[Sequence[int]]) -> PrefixTrie:
+        return cls.from_csr(*pack(seqs))
+
+    @classmethod
+    def from_csr(cls, offsets: np.ndarray, symbols: np.ndarray) -> PrefixTrie:
+        """
+        Builds the trie one depth at a time.
+
+        Args:
+            offsets: Where each sequence starts in symbols, plus the end.
+            symbols: The symbols of every sequence laid end to end.
+
+        Returns:
+            The trie.
+        """
+        lengths = np.diff(offsets)
+        width = int(symbols.max(initial=0)) + 1
+        # Longest first so the sequences still being read are always a prefix.
+        order = np.argsort(-lengths, kind="stable")
+        active = np.searchsorted(-lengths[order], -np.arange(lengths.max(initial=0)))
+        leaves = np.zeros(len(lengths), dtype=np.int64)
+        parents, syms, starts = [np.array([-1])], [np.array([0])], [0, 1]
+        for pos, num in enumerate(active):
+            live = order[:num]
+            # Sequences that share a parent and a next symbol share a node.
+            keys, inverse = np.unique(
+                leaves[live] * width + symbols[offsets[live] + pos],
+                return_inverse=True,
+            )
+            parents.append(keys // width)
+            syms.append(keys % width)
+            leaves[live] = starts[-1] + inverse.reshape(-1)
+            starts.append(starts[-1] + len(keys))
+        return cls(
+            parent=np.concatenate(parents),
+            symbol=np.concatenate(syms),
+            offsets=np.array(starts, dtype=np.int64),
+            leaves=leaves,
+        )
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.parent)